@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# Generátor syntetických dat nehod ve formátu stažených archivů:
+# roční zip soubory s CSV krajů (cp1250, oddělovač ';', hodnoty v uvozovkách,
+# hlavičky DataDownloader.headers) včetně hodnot "XX", prázdných hodnot
+# a duplicitních p1 mezi roky, a k nim DataFrame accidents.pkl.gz (vstup 2. a 3. části).
+import csv
+import os
+import sys
+import zipfile
+from argparse import ArgumentParser
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "izv-part01"))
+from download import DataDownloader  # noqa: E402
+
+# Rozsahy hodnot číselných sloupců (včetně), ostatní celočíselné sloupce 0-9
+VALUE_RANGES: Dict[str, Tuple[int, int]] = {
+    "p36": (0, 8), "p37": (0, 9999), "p2b": (0, 2359), "p12": (100, 615),
+    "p13a": (0, 2), "p13b": (0, 2), "p13c": (0, 3), "p14": (0, 5000),
+    "p34": (1, 4), "p44": (0, 19), "p45a": (1, 80), "p47": (0, 99),
+    "p53": (0, 5000), "n": (0, 99999), "r": (0, 999999), "s": (0, 999999),
+}
+
+# Pravděpodobnosti hodnot úmrtí (p13a): většina nehod bez úmrtí
+P13A_WEIGHTS = [0.97, 0.025, 0.005]
+
+# Hodnoty řetězcových sloupců (s diakritikou, kódování cp1250)
+STRINGS = ["", "Silnice", "Obec Žďár", "Třebíč", "Kraj Vysočina", "Ústí nad Labem",
+           "Brno-město", "ulice Dlouhá", "Mladá Boleslav", "Jihlava"]
+
+# Rozsah souřadnic S-JTSK pro ČR (d, e)
+D_RANGE = (-900000.0, -430000.0)
+E_RANGE = (-1230000.0, -935000.0)
+
+
+def _region_rows(rng: np.random.Generator, year: int, rows: int, p1_start: int,
+                 previous_p1: np.ndarray, duplicates: float) -> Dict[str, np.ndarray]:
+    """ Hodnoty sloupců rows řádků kraje v roce year (typy dle DataDownloader.header_types),
+    podíl duplicates řádků převezme p1 z předchozího roku (previous_p1). """
+
+    data = {}
+    for header in DataDownloader.headers:
+        dtype = DataDownloader.header_types[header]
+        if header == "p1":
+            values = np.arange(p1_start, p1_start + rows, dtype=np.uint64)
+            duplicate = rng.random(rows) < duplicates if len(previous_p1) else np.zeros(rows, dtype=bool)
+            values[duplicate] = rng.choice(previous_p1, np.count_nonzero(duplicate))
+        elif header == "p2a":
+            days = rng.integers(0, 365, rows)
+            values = (np.datetime64(f"{year}-01-01") + days).astype(str)
+        elif header == "weekday(p2a)":
+            values = None  # doplněno podle p2a
+        elif header == "p13a":
+            values = rng.choice(len(P13A_WEIGHTS), rows, p=P13A_WEIGHTS)
+        elif header in ("d", "e"):
+            low, high = D_RANGE if header == "d" else E_RANGE
+            values = rng.uniform(low, high, rows).round(2)
+        elif dtype is np.double:
+            values = rng.uniform(-1e6, 1e6, rows).round(2)
+        elif np.issubdtype(dtype, np.integer):
+            low, high = VALUE_RANGES.get(header, (0, 9))
+            values = rng.integers(low, high + 1, rows)
+        else:
+            values = np.asarray(STRINGS, dtype=object)[rng.integers(0, len(STRINGS), rows)]
+        data[header] = values
+
+    data["weekday(p2a)"] = (pd.to_datetime(data["p2a"]).dayofweek.to_numpy() + 1) % 7
+    return data
+
+
+def _csv_columns(rng: np.random.Generator, data: Dict[str, np.ndarray],
+                 invalid: float, blank: float) -> pd.DataFrame:
+    """ Textové hodnoty CSV s desetinnou čárkou. Podíl invalid řádků má v jednom
+    náhodném číselném sloupci (kromě p1) hodnotu "XX", podíl blank řádků prázdnou hodnotu. """
+
+    # Číselné sloupce, do kterých se vkládají neplatné hodnoty
+    numeric = [header for header in data if header != "p1" and DataDownloader.header_types[header] is not np.unicode_]
+    rows = len(data["p1"])
+    draw = rng.random(rows)
+    replacement = np.where(draw < invalid, "XX", np.where(draw < invalid + blank, "", None))
+    target = np.where(replacement != None, rng.integers(0, len(numeric), rows), -1)  # noqa: E711
+
+    columns = {}
+    for header, values in data.items():
+        if DataDownloader.header_types[header] is np.double:
+            text = np.char.replace(np.char.mod("%.2f", values), ".", ",").astype(object)
+        else:
+            text = np.asarray(values).astype(str).astype(object)
+
+        if header in numeric:
+            selected = target == numeric.index(header)
+            text[selected] = replacement[selected]
+        columns[header] = text
+    return pd.DataFrame(columns)
+
+
+def _frame_rows(csv_columns: pd.DataFrame, region: str) -> pd.DataFrame:
+    """ Řádky pro accidents.pkl.gz: neznámé celočíselné hodnoty ("XX", prázdné) jsou -1,
+    neznámé souřadnice NaN. """
+
+    frame = {}
+    for header in csv_columns.columns:
+        dtype = DataDownloader.header_types[header]
+        text = csv_columns[header]
+        if dtype is np.double:
+            frame[header] = pd.to_numeric(text.str.replace(",", ".", regex=False), errors="coerce")
+        elif np.issubdtype(dtype, np.integer):
+            frame[header] = pd.to_numeric(text, errors="coerce").fillna(-1).astype(np.int64)
+        else:
+            frame[header] = text
+    frame["region"] = region
+    return pd.DataFrame(frame)
+
+
+def generate(folder: str, years: List[int], rows: int, seed: int = 0, invalid: float = 0.002,
+             blank: float = 0.002, duplicates: float = 0.01) -> List[str]:
+    """ Vytvoření zip souborů data{rok}.zip (rows řádků na kraj a rok) a accidents.pkl.gz
+    ve složce folder. Vrací cesty k zip souborům v pořadí roků. """
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    zip_paths, frames = [], []
+    previous_p1 = {region: np.empty(0, dtype=np.uint64) for region in DataDownloader.regions}
+    p1_start = 1
+    for year in years:
+        zip_path = os.path.join(folder, f"data{year}.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for region, code in DataDownloader.regions.items():
+                data = _region_rows(rng, year, rows, p1_start, previous_p1[region], duplicates)
+                previous_p1[region] = data["p1"]
+                p1_start += rows
+
+                csv_columns = _csv_columns(rng, data, invalid, blank)
+                csv_text = csv_columns.to_csv(sep=";", header=False, index=False, quoting=csv.QUOTE_ALL,
+                                              lineterminator="\r\n")
+                zf.writestr(f"{code}.csv", csv_text.encode("cp1250"))
+                frames.append(_frame_rows(csv_columns, region))
+        zip_paths.append(zip_path)
+
+    # DataFrame všech nehod (duplicitní p1 mezi roky ponechány jako ve zdrojových datech)
+    pd.concat(frames, ignore_index=True).to_pickle(os.path.join(folder, "accidents.pkl.gz"),
+                                                   compression={"method": "gzip", "compresslevel": 1})
+    return zip_paths
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("folder", type=str, help="Output directory")
+    parser.add_argument("--years", type=int, nargs="+", default=list(range(2016, 2022)), help="Years (one zip each)")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per region and year")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--invalid", type=float, default=0.002, help="Share of rows with an \"XX\" value")
+    parser.add_argument("--blank", type=float, default=0.002, help="Share of rows with a blank numeric value")
+    parser.add_argument("--duplicates", type=float, default=0.01, help="Share of p1 repeated from the previous year")
+    args = parser.parse_args()
+
+    for zip_path in generate(args.folder, args.years, args.rows, args.seed, args.invalid, args.blank,
+                             args.duplicates):
+        print(zip_path)
+
+
+if __name__ == "__main__":
+    main()
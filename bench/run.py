@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# Měření jednotlivých kroků zpracování (parsování archivů, cache, DataFrame, grafy)
+# nad syntetickými daty (generate.py). Výsledky (čas a nejvyšší alokovaná paměť
+# podle tracemalloc) se ukládají do JSON a lze je porovnat s dřívějším během.
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Callable, Dict, List
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from generate import generate  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("izv-part01", "izv-part02", "izv-part03-var-nehody"):
+    sys.path.append(os.path.join(ROOT, directory))
+
+import analysis  # noqa: E402
+import doc  # noqa: E402
+import get_stat  # noqa: E402
+from download import DataDownloader  # noqa: E402
+
+# Kraj pro měření zpracování jednoho kraje
+REGION = "VYS"
+
+
+class Benchmark:
+    """ Postupné měření kroků, výsledky v results (krok -> {"seconds": ...}, s memory
+    krok -> {"peak_mb": ...}). Sledování paměti výrazně zpomaluje, čas a paměť
+    se proto měří v oddělených bězích. """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def measure(self, name: str, func: Callable[[], object]) -> object:
+        """ Změření času kroku func, s memory nejvyšší alokované paměti v hlavním procesu. """
+
+        gc.collect()
+        if self.memory:
+            tracemalloc.start()
+            value = func()
+            result = {"peak_mb": tracemalloc.get_traced_memory()[1] / 1e6}
+            tracemalloc.stop()
+            print(f"{name}: {result['peak_mb']:.1f} MB")
+        else:
+            start = time.perf_counter()
+            value = func()
+            result = {"seconds": time.perf_counter() - start}
+            print(f"{name}: {result['seconds']:.3f} s")
+        plt.close("all")
+
+        self.results[name] = result
+        return value
+
+
+def _downloader(folder: str, zip_paths: List[str]) -> DataDownloader:
+    """ DataDownloader nad lokálními archivy (bez stahování). """
+
+    downloader = DataDownloader(folder=folder)
+    downloader.downloaded = True
+    downloader.downloaded_zips = list(zip_paths)
+    return downloader
+
+
+def run(workdir: str, rows: int, years: List[int], workers: int = None, memory: bool = False,
+        geo_plots: bool = True) -> Dict[str, Dict[str, float]]:
+    """ Vytvoření dat (pokud ve workdir nejsou) a měření všech kroků. """
+
+    bench = Benchmark(memory)
+    data_dir = os.path.join(workdir, f"data_{rows}x{len(years)}")
+    cache_dir = os.path.join(workdir, "cache")
+    figures_dir = os.path.join(workdir, "figures")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(figures_dir, exist_ok=True)
+
+    zip_paths = [os.path.join(data_dir, f"data{year}.zip") for year in years]
+    accidents = os.path.join(data_dir, "accidents.pkl.gz")
+    if not all(os.path.exists(path) for path in [*zip_paths, accidents]):
+        print(f"Generování dat do {data_dir}")
+        generate(data_dir, years, rows)
+
+    # 1. část: archivy a cache krajů
+    bench.measure("parse_region_data", lambda: _downloader(cache_dir, zip_paths).parse_region_data(REGION))
+    bench.measure("get_dict_cold", lambda: _downloader(cache_dir, zip_paths).get_dict(workers=workers))
+    bench.measure("get_dict_warm", lambda: _downloader(cache_dir, zip_paths).get_dict(workers=workers))
+    bench.measure("iter_batches_columns", lambda: sum(len(batch["p24"]) for batch in _downloader(
+        cache_dir, zip_paths).iter_batches(columns=["region", "p24"])))
+    stat_data = bench.measure("get_dict_columns", lambda: _downloader(cache_dir, zip_paths).get_dict(
+        columns=["region", "p24"], decode=False))
+    bench.measure("plot_stat", lambda: get_stat.plot_stat(stat_data, os.path.join(figures_dir, "stat.png")))
+
+    # 2. část: DataFrame a grafy
+    compact = analysis._compact_filename(accidents)
+    if os.path.exists(compact):
+        os.remove(compact)
+    bench.measure("get_dataframe_nocache", lambda: analysis.get_dataframe(accidents, use_cache=False))
+    bench.measure("get_dataframe_cold", lambda: analysis.get_dataframe(accidents))
+    df = bench.measure("get_dataframe_warm", lambda: analysis.get_dataframe(accidents))
+    for plot in (analysis.plot_roadtype, analysis.plot_animals, analysis.plot_conditions):
+        bench.measure(plot.__name__, lambda: plot(df, os.path.join(figures_dir, f"{plot.__name__}.png")))
+
+    # 3. část: grafy nad původním DataFrame
+    raw = pd.read_pickle(accidents)
+    bench.measure("plot_doc", lambda: doc.plot_doc(raw, os.path.join(figures_dir, "doc.png")))
+    if geo_plots:
+        try:
+            import geo
+            from tiles import TileCache
+        except ImportError as error:
+            print(f"geo: přeskočeno ({error})")
+        else:
+            # Podkladová mapa jen z lokální (prázdné) cache dlaždic, bez sítě
+            tiles = TileCache("", os.path.join(workdir, "tiles"), offline=True)
+            if os.path.exists(geo._geo_filename(accidents)):
+                os.remove(geo._geo_filename(accidents))
+            bench.measure("load_geo_cold", lambda: geo.load_geo(accidents))
+            gdf = bench.measure("load_geo_warm", lambda: geo.load_geo(accidents))
+            # Shlukuje se jen vybraný kraj, při malém rozsahu dat může mít méně bodů než shluků
+            cluster_points = int(((gdf["region"] == geo.REGION) & (gdf["p36"] == 1)).sum())
+            for mode in ("points", "density"):
+                bench.measure(f"plot_geo_{mode}", lambda: geo.plot_geo(
+                    gdf, os.path.join(figures_dir, f"geo_{mode}.png"), tiles=tiles, mode=mode))
+                if cluster_points < geo.N_CLUSTERS:
+                    print(f"plot_cluster_{mode}: přeskočeno ({cluster_points} bodů, {geo.N_CLUSTERS} shluků)")
+                    continue
+                # "auto" jako škálovatelný režim pro velký rozsah dat (přesné shlukování je O(n²))
+                bench.measure(f"plot_cluster_{mode}", lambda: geo.plot_cluster(
+                    gdf, os.path.join(figures_dir, f"cluster_{mode}.png"), method="auto", tiles=tiles,
+                    mode=mode))
+    return bench.results
+
+
+def _environment() -> Dict[str, str]:
+    """ Popis prostředí a verze kódu pro uložené výsledky. """
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline_path: str) -> None:
+    """ Výpis poměru času (a paměti) kroků vůči uloženým výsledkům baseline_path. """
+
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+
+    print(f"\nPorovnání s {baseline_path} (nový / původní):")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratios = [f"{key} {result[key] / baseline[name][key]:.2f}x"
+                  for key in ("seconds", "peak_mb") if key in result and baseline[name].get(key)]
+        print(f"{name}: " + ", ".join(ratios))
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--workdir", type=str, default=os.path.join(os.path.dirname(__file__), "work"),
+                        help="Directory for generated data, caches and figures")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per region and year")
+    parser.add_argument("--years", type=int, nargs="+", default=list(range(2016, 2022)), help="Years")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for parsing")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the second, memory-traced pass")
+    parser.add_argument("--no-geo", action="store_true", help="Skip geo plots")
+    parser.add_argument("--output", type=str, default=None, help="Results file (default results/<time>.json)")
+    parser.add_argument("--compare", type=str, default=None, help="Earlier results file to compare with")
+    args = parser.parse_args()
+
+    results = run(args.workdir, args.rows, args.years, args.workers, False, not args.no_geo)
+    if not args.no_memory:
+        print("\nPaměť (tracemalloc):")
+        peaks = run(args.workdir, args.rows, args.years, args.workers, True, not args.no_geo)
+        for name, peak in peaks.items():
+            results[name].update(peak)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "results",
+                                         time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump({"rows": args.rows, "years": args.years, "environment": _environment(), "results": results},
+                  file, indent=2)
+    print(f"\nVýsledky uloženy do {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from typing import Dict, Iterable, Tuple, Union
+
+import numpy as np
+
+# Kontingenční tabulky (počty dvojic hodnot) nad kódovanými sloupci, např. region × p24.
+
+
+def crosstab(row_codes:np.ndarray, col_codes:np.ndarray, shape:Union[None, Tuple[int, int]]=None) -> np.ndarray:
+    """Kontingenční tabulka dvou sloupců celočíselných kódů jedním průchodem
+    (np.bincount nad kombinovaným kódem řádek * počet sloupců + sloupec).
+    Bez zadaného tvaru se použije (max + 1) obou sloupců. Dvojice se záporným kódem (neznámá hodnota, -1)
+    nebo s kódem mimo zadaný tvar jsou vynechány."""
+    row_codes = np.asarray(row_codes).astype(np.intp, copy=False)
+    col_codes = np.asarray(col_codes).astype(np.intp, copy=False)
+
+    valid = (row_codes >= 0) & (col_codes >= 0)
+    if shape is not None:
+        valid &= (row_codes < shape[0]) & (col_codes < shape[1])
+    if not valid.all():
+        row_codes, col_codes = row_codes[valid], col_codes[valid]
+
+    if shape is None:
+        shape = (int(row_codes.max(initial=-1)) + 1, int(col_codes.max(initial=-1)) + 1)
+
+    combined = row_codes * shape[1] + col_codes
+    return np.bincount(combined, minlength=shape[0] * shape[1]).reshape(shape)
+
+
+def crosstab_batches(batches:Iterable[Dict[str, np.ndarray]], row_column:str, col_column:str,
+                     shape:Tuple[int, int]) -> np.ndarray:
+    """Kontingenční tabulka sloupců row_column × col_column postupně sčítaná přes dávky dat
+    (např. DataDownloader.iter_batches), v paměti je vždy jen jedna dávka."""
+    counts = np.zeros(shape, dtype=np.int64)
+    for batch in batches:
+        counts += crosstab(batch[row_column], batch[col_column], shape)
+    return counts
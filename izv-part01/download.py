@@ -1,20 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import codecs
 import csv
 import gzip
+import io
+import json
 import pickle
 import time
 import zipfile
-from multiprocessing import Manager, Pool, cpu_count
-from os import makedirs
-from os.path import exists
-from typing import Dict, List, Union
+from contextlib import contextmanager
+from multiprocessing import Pool, cpu_count, resource_tracker
+from multiprocessing.pool import ThreadPool
+from multiprocessing.shared_memory import SharedMemory
+from os import makedirs, remove, replace, stat
+from os.path import exists, getsize
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
 
 import numpy as np
 import requests
 from bs4 import BeautifulSoup
 
+try:
+    import fcntl
+except ImportError:
+    #Bez fcntl (Windows) se soubor slovníků nezamyká, souběžné instance pak nejsou chráněny.
+    fcntl = None
+
+from crosstab import crosstab
+
+#Podmínka filtru na sloupec: hodnota, množina hodnot nebo rozsah (od, do).
+Filter = Union[int, float, str, List, Set, Tuple]
+
 # Kromě vestavěných knihoven (os, sys, re, requests …) byste si měli vystačit s: gzip, pickle, csv, zipfile, numpy, matplotlib, BeautifulSoup.
 # Další knihovny je možné použít po schválení opravujícím (např ve fóru WIS).
 
@@ -23,6 +38,9 @@ class DataDownloader:
         headers         Nazvy hlavicek jednotlivych CSV souboru, tyto nazvy nemente!  
         header_types    Dictionary s numpy typy hlavicek
         regions         Dictionary s nazvy kraju : nazev csv souboru
+
+        dropped_duplicates  Pocty vynechanych duplicitnich radku (p1) pro kraj : zip soubor
+        categories          Slovniky (hodnoty) kodovanych retezcovych sloupcu, kod je index do pole
     """
 
     headers = ["p1", "p36", "p37", "p2a", "weekday(p2a)", "p2b", "p6", "p7", "p8", "p9", "p10", "p11", "p12", "p13a",
@@ -69,17 +87,26 @@ class DataDownloader:
         "LBK": "18", "KVK": "19",
     }
 
-    def __init__(self, url:str="https://ehw.fit.vutbr.cz/izv/", folder:str="data", cache_filename:str="data_{}.pkl.gz"):
+    #Seřazené zkratky krajů, kód kraje ve sloupci region je index do tohoto pole.
+    region_codes = np.array(sorted(regions.keys()))
+
+    def __init__(self, url:str="https://ehw.fit.vutbr.cz/izv/", folder:str="data", cache_filename:str="data_{}.pkl.gz",
+                 cache_dirname:str="data_{}.cache"):
         self.url = url
         self.folder = folder
         self.downloaded = False
         self.extracted_data = { region : None for region in self.regions.keys() }
+        self.dropped_duplicates : Dict[str, Dict[str, int]] = {}
         self.cache_file = f"{folder}/{cache_filename}"
+        self.cache_dir = f"{folder}/{cache_dirname}"
+        self.categories_file = f"{folder}/categories.json"
+        self.categories = self._load_categories()
+        self.session = requests.Session()
 
 
-    def download_data(self) -> None:
+    def download_data(self, workers:int=8) -> None:
         # Parsování HTML stránky a načtení seznamu souborů ke stažení.
-        page = requests.get(self.url).text
+        page = self.session.get(self.url).text
         soup = BeautifulSoup(page, 'html.parser')
         file_urls = [ self.url + node.get("onclick").replace("download('", "").replace("')", "")
             for node in soup.find_all("button")
@@ -88,118 +115,797 @@ class DataDownloader:
         # Cílová složka nemusí existovat, pokus o její vytvoření.
         makedirs(self.folder, exist_ok=True)
 
-        # Seznam stažených souborů.
-        manager = Manager()
-        self.downloaded_zips : List[str] = manager.list()
-
-        # Paralelní stažení všech sourobů.
-        pool = Pool(cpu_count())
-        pool.map(self._download_subroutine, file_urls)
-        pool.close()
-        pool.join()
+        # Paralelní stažení všech souborů, stahování je vázané na I/O, stačí omezený počet vláken se sdílenou session.
+        # Seznam stažených souborů je v pořadí dle HTML stránky.
+        with ThreadPool(min(workers, max(len(file_urls), 1))) as pool:
+            self.downloaded_zips : List[str] = pool.map(self._download_subroutine, file_urls)
         self.downloaded = True
 
 
-    def _download_subroutine(self, file_url:str) -> None:
-        """Podprogram pro stažení souboru spouštěný paralelně."""
+    def _download_subroutine(self, file_url:str) -> str:
+        """Podprogram pro stažení souboru spouštěný paralelně, vrací cestu souboru.
+        Soubor se stahuje do dočasného souboru .part (nedokončené stažení se navazuje pomocí hlavičky Range
+        s If-Range, změněný soubor na serveru se tak stáhne celý znovu), po ověření délky (Content-Length)
+        je atomicky přejmenován. Již stažený soubor se stáhne znovu jen pokud se na serveru změnil
+        (If-None-Match/If-Modified-Since dle uložených hlaviček v souboru .meta)."""
 
         # Získání cesty souboru smazáním url.
         file_path = file_url.replace(self.url, "")
-        self.downloaded_zips.append(file_path)
+        part_path, meta_path = f"{file_path}.part", f"{file_path}.meta"
+        part_meta_path = f"{part_path}.meta"
+
+        headers = {}
+        if exists(part_path):
+            # Navázání nedokončeného stažení, jen pokud se soubor na serveru mezitím nezměnil.
+            offset = getsize(part_path)
+            headers["Range"] = f"bytes={offset}-"
+            part_meta = self._load_download_meta(part_meta_path)
+            validator = part_meta.get("etag") or part_meta.get("last_modified")
+            if validator:
+                headers["If-Range"] = validator
+        else:
+            offset = 0
+            # Podmíněný požadavek pro kompletně stažený soubor (velikost odpovídá uloženým metadatům).
+            if exists(file_path):
+                meta = self._load_download_meta(meta_path)
+                if meta.get("size") == getsize(file_path):
+                    if meta.get("etag"):
+                        headers["If-None-Match"] = meta["etag"]
+                    if meta.get("last_modified"):
+                        headers["If-Modified-Since"] = meta["last_modified"]
+
+        with self.session.get(file_url, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return file_path
+
+            if response.status_code == 416:
+                # Soubor .part je už celý (přerušeno před přejmenováním), jinak stáhnout znovu od začátku.
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                if total.isdigit() and int(total) == offset:
+                    meta = { **self._load_download_meta(part_meta_path), "size" : offset }
+                    return self._finish_download(file_url, file_path, meta)
+                remove(part_path)
+                if exists(part_meta_path):
+                    remove(part_meta_path)
+                return self._download_subroutine(file_url)
+            response.raise_for_status()
+
+            # Server nepodporuje Range nebo se soubor změnil (If-Range), stahovat od začátku.
+            if response.status_code != 206:
+                offset = 0
+
+            meta = {
+                "etag" : response.headers.get("ETag"),
+                "last_modified" : response.headers.get("Last-Modified"),
+            }
+            if offset == 0:
+                # Hlavičky verze souboru, ze které je stažen .part (pro If-Range při navázání).
+                with open(part_meta_path, "w") as file:
+                    json.dump(meta, file)
+
+            # Proces stažení souboru.
+            self._print_message(f"Downloading {file_url}...")
+            with open(part_path, "ab" if offset > 0 else "wb") as file:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    file.write(chunk)
 
-        # Nestahovat znovu, pokud soubor existuje.
-        if exists(file_path):
-            return
+            # Ověření délky staženého souboru, nekompletní soubor zůstává pro navázání.
+            if "Content-Length" in response.headers:
+                expected_size = offset + int(response.headers["Content-Length"])
+                if getsize(part_path) != expected_size:
+                    raise IOError(f"Incomplete download of {file_url}: {getsize(part_path)} of {expected_size} bytes")
 
-        # Proces stažení souboru.
-        self._print_message(f"Downloading {file_url}...")
-        with open(file_path, "wb") as file:
-            with requests.get(file_url, stream=True) as data:
-                for chunk in data:
-                    file.write(chunk)
+            meta["size"] = getsize(part_path)
+
+        return self._finish_download(file_url, file_path, meta)
+
+
+    @staticmethod
+    def _load_download_meta(meta_path:str) -> Dict[str, Union[None, str, int]]:
+        """Načtení uložených hlaviček stahovaného souboru (prázdný slovník, pokud nejsou)."""
+        if not exists(meta_path):
+            return {}
+        with open(meta_path, "r") as file:
+            return json.load(file)
+
+
+    def _finish_download(self, file_url:str, file_path:str, meta:Dict[str, Union[None, str, int]]) -> str:
+        """Atomické přejmenování kompletního souboru .part a uložení jeho hlaviček do souboru .meta."""
+        part_path = f"{file_path}.part"
+        replace(part_path, file_path)
+        with open(f"{file_path}.meta", "w") as file:
+            json.dump(meta, file)
+        if exists(f"{part_path}.meta"):
+            remove(f"{part_path}.meta")
         self._print_message(f"Done downloading {file_url}...")
+        return file_path
+
+
+    @classmethod
+    def _select_headers(cls, columns:Union[None, List[str]]=None) -> List[str]:
+        """Seznam hlaviček (v pořadí headers) z požadovaných sloupců, None znamená všechny sloupce."""
+        if columns is None:
+            return list(cls.headers)
+        return [ header for header in cls.headers if header in columns ]
+
+
+    @classmethod
+    def _create_empty_data_dict(cls, columns:Union[None, List[str]]=None) -> Dict[str, np.ndarray]:
+        """Vytvoření slovníku s hlavičkami (případně jen zadanými sloupci) a prázdnými numpy poli."""
+        return { header : np.empty(shape=0, dtype=cls.header_types[header]) for header in cls._select_headers(columns) }
+
+
+    @classmethod
+    def _parse_csv(cls, csv_bytes:bytes, columns:Union[None, List[str]]=None) -> Dict[str, np.ndarray]:
+        """Načtení celého CSV souboru kraje po sloupcích a jejich vektorizovaný převod na numpy typy.
+        Řádky s prázdnými a nevalidními ("XX") hodnotami v číselných sloupcích jsou vynechány.
+        Převáděny jsou jen požadované sloupce columns (None znamená všechny)."""
+        reader = csv.reader(io.StringIO(csv_bytes.decode("cp1250")), delimiter=';', quotechar='"')
+        raw_columns = list(zip(*reader))
+        if len(raw_columns) == 0:
+            return cls._create_empty_data_dict(columns)
+
+        #Maska validních řádků (bez prázdných a "XX" hodnot v číselných sloupcích).
+        valid = np.ones(len(raw_columns[0]), dtype=bool)
+        for header, raw_column in zip(cls.headers, raw_columns):
+            if cls.header_types[header] is not np.unicode_:
+                column = np.array(raw_column)
+                valid &= (column != "") & (column != "XX")
+
+        data = {}
+        selected = cls._select_headers(columns)
+        for header, raw_column in zip(cls.headers, raw_columns):
+            if header not in selected:
+                continue
+
+            column = np.array(raw_column)[valid]
+            if cls.header_types[header] is np.unicode_:
+                #Šířka řetězců podle nejdelší ponechané hodnoty.
+                data[header] = column.astype(f"<U{np.char.str_len(column).max(initial=1)}")
+                continue
+
+            #Úprava desetinné čárky na tečku.
+            if cls.header_types[header] is np.double:
+                column = np.char.replace(column, ',', '.')
+
+            data[header] = column.astype(cls.header_types[header])
+        return data
 
 
-    def _create_empty_data_dict(self) -> Dict[str, np.ndarray]:
-        """Vytvoření slovníku s hlavičkami a prázdnými numpy poli."""
-        return { header : np.empty(shape=0, dtype=self.header_types[header]) for header in self.headers }
+    @staticmethod
+    def _drop_duplicates(data:Dict[str, np.ndarray], seen_p1:np.ndarray) -> Dict[str, np.ndarray]:
+        """Odstranění duplicitních řádků (dle p1) v rámci dat i vůči již zpracovaným hodnotám seen_p1.
+        Ponechává se první výskyt, pořadí řádků zůstává zachováno."""
+        _, first_indeces = np.unique(data["p1"], return_index=True)
+        first_indeces.sort()
+        keep = first_indeces[~np.isin(data["p1"][first_indeces], seen_p1, assume_unique=True)]
+        return { header : column[keep] for header, column in data.items() }
+
+
+    @classmethod
+    def _parse_zip(cls, zip_path:str, regions:List[str], columns:Union[None, List[str]]=None) -> Dict[str, Dict[str, np.ndarray]]:
+        """Načtení csv souborů všech zadaných krajů z jednoho zip souboru při jediném otevření archivu."""
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            return { region : cls._parse_csv(zf.read(cls.regions[region] + ".csv"), columns) for region in regions }
+
+
+    @classmethod
+    def _parse_zip_shared(cls, zip_path:str, regions:List[str],
+                          columns:Union[None, List[str]]=None) -> Tuple[str, List[Tuple[str, str, str, int, int]]]:
+        """Podprogram spouštěný paralelně: načte kraje ze zip souboru a výsledné sloupce uloží do sdílené paměti,
+        aby se data nemusela při návratu do rodičovského procesu serializovat. Vrací název bloku a rozložení sloupců."""
+        zip_part = cls._parse_zip(zip_path, regions, columns)
+
+        #Rozložení sloupců v bloku (kraj, hlavička, dtype, počet prvků, offset), zarovnáno na 8 B.
+        layout, offset = [], 0
+        for region, data in zip_part.items():
+            for header, column in data.items():
+                layout.append((region, header, column.dtype.str, column.size, offset))
+                offset += -(-column.nbytes // 8) * 8
+
+        shm = SharedMemory(create=True, size=max(offset, 1))
+        for region, header, dtype, size, offset in layout:
+            np.ndarray(size, dtype=dtype, buffer=shm.buf, offset=offset)[:] = zip_part[region][header]
+        shm.close()
+
+        #Blok uvolňuje (unlink) až rodičovský proces.
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm.name, layout
 
 
-    def parse_region_data(self, region:str) -> Dict[str, np.ndarray]:
+    @staticmethod
+    def _unlink_shared(names:Iterable[str]) -> None:
+        """Uvolnění bloků sdílené paměti podle názvů (již uvolněné bloky se přeskočí)."""
+        for name in names:
+            try:
+                shm = SharedMemory(name=name)
+            except FileNotFoundError:
+                continue
+            shm.close()
+            shm.unlink()
+
+
+    @staticmethod
+    def _attach_shared(name:str, layout:List[Tuple[str, str, str, int, int]]) -> Tuple[SharedMemory, Dict[str, Dict[str, np.ndarray]]]:
+        """Připojení bloku sdílené paměti a vytvoření pohledů na jednotlivé sloupce (bez kopírování)."""
+        shm = SharedMemory(name=name)
+        zip_part : Dict[str, Dict[str, np.ndarray]] = {}
+        for region, header, dtype, size, offset in layout:
+            zip_part.setdefault(region, {})[header] = np.ndarray(size, dtype=dtype, buffer=shm.buf, offset=offset)
+        return shm, zip_part
+
+
+    def parse_regions_data(self, regions:List[str], workers:Union[None, int]=None, zip_paths:Union[None, List[str]]=None,
+                           seen_p1:Union[None, Dict[str, np.ndarray]]=None,
+                           columns:Union[None, List[str]]=None) -> Dict[str, Dict[str, np.ndarray]]:
+        """Zpracování dat více krajů najednou. Každý zip soubor je otevřen jen jednou
+        a archivy jsou zpracovávány paralelně v `workers` procesech (výchozí: počet CPU).
+        Volitelně lze zpracovat jen vybrané archivy `zip_paths` a vynechat řádky s p1 již obsaženými v `seen_p1` kraje.
+        Převedeny jsou jen sloupce `columns` (sloupec p1 vždy, je potřeba pro odstranění duplicit).
+        Data jsou v kompaktní podobě (viz _encode)."""
         if not self.downloaded:
             self.download_data()
-        
-        region_csv_name = self.regions[region] + ".csv"
-        data = self._create_empty_data_dict()
-
-        for zip_path in self.downloaded_zips:
-            with zipfile.ZipFile(zip_path, "r") as zf:
-                #V každém zip souboru, otevřít csv soubor daného kraje.
-                with zf.open(region_csv_name, "r") as csv_file:
-                    reader = csv.reader(codecs.iterdecode(csv_file, "cp1250"), delimiter=';', quotechar='"')
-                    #Načíst jednotlivé řádky souboru.
-                    for row in reader:
-                        #Přeskočit řádky s prázdnými a nevalidními položkami.
-                        if any(self.header_types[header] is not np.unicode_ and row[i] in ("", "XX") for i, header in enumerate(self.headers)):
-                            continue
-
-                        #Přeskočit duplicitní řádky.
-                        if self.header_types["p1"](row[0]) in data["p1"]:
-                            continue
-
-                        for i, header in enumerate(self.headers):
-                            #Úprava desetinné čárky na tečku.
-                            if self.header_types[header] is np.double:
-                                row[i] = row[i].replace(',', '.')
-
-                            data[header] = np.append(data[header], self.header_types[header](row[i]))
 
+        columns = self._select_headers(None if columns is None else ["p1", *columns])
+
+        if zip_paths is None:
+            zip_paths = list(self.downloaded_zips)
+        if seen_p1 is None:
+            seen_p1 = {}
+        workers = min(workers or cpu_count(), len(zip_paths))
+        if workers <= 1:
+            zip_parts = [self._parse_zip(zip_path, regions, columns) for zip_path in zip_paths]
+            return { region : self._merge_region(region, zip_paths, zip_parts, seen_p1.get(region), columns)
+                for region in regions }
+
+        #Paralelní načtení csv souborů všech krajů z jednotlivých archivů (výsledky v pořadí archivů).
+        #Čeká se na všechny úlohy, aby při chybě některé z nich šlo uvolnit bloky úspěšně dokončených.
+        results, error = [], None
+        with Pool(workers) as pool:
+            tasks = [ pool.apply_async(self._parse_zip_shared, (zip_path, regions, columns)) for zip_path in zip_paths ]
+            for task in tasks:
+                try:
+                    results.append(task.get())
+                except Exception as exception:
+                    error = error or exception
+        if error is not None:
+            self._unlink_shared(name for name, _ in results)
+            raise error
+
+        shared_blocks : List[SharedMemory] = []
+        zip_parts = []
+        try:
+            for name, layout in results:
+                shm, zip_part = self._attach_shared(name, layout)
+                shared_blocks.append(shm)
+                zip_parts.append(zip_part)
+
+            return { region : self._merge_region(region, zip_paths, zip_parts, seen_p1.get(region), columns)
+                for region in regions }
+        finally:
+            #Data jsou zkopírována do výsledných polí (nebo zpracování selhalo), uvolnit sdílenou paměť.
+            zip_parts.clear()
+            for shm in shared_blocks:
+                try:
+                    shm.close()
+                except BufferError:
+                    #Pohledy na blok drží ještě traceback výjimky, blok se odmapuje po jejich uvolnění.
+                    pass
+            self._unlink_shared(name for name, _ in results)
+
+
+    def _merge_region(self, region:str, zip_paths:List[str], zip_parts:List[Dict[str, Dict[str, np.ndarray]]],
+                      seen_p1:Union[None, np.ndarray]=None, columns:Union[None, List[str]]=None) -> Dict[str, np.ndarray]:
+        """Spojení dat kraje ze všech archivů (v pořadí archivů) s vynecháním duplicitních řádků."""
+        parts = [self._create_empty_data_dict(columns)]
+        if seen_p1 is None:
+            seen_p1 = parts[0]["p1"]
+        self.dropped_duplicates[region] = {}
+
+        for zip_path, zip_part in zip(zip_paths, zip_parts):
+            part = zip_part[region]
+
+            #Přeskočit duplicitní řádky (ponechat první výskyt p1).
+            unique_part = self._drop_duplicates(part, seen_p1)
+            seen_p1 = np.concatenate((seen_p1, unique_part["p1"]))
+            parts.append(unique_part)
+
+            dropped = part["p1"].size - unique_part["p1"].size
+            self.dropped_duplicates[region][zip_path] = dropped
+            if dropped > 0:
+                self._print_message(f"Dropped {dropped} duplicate rows from {zip_path} ({region})...")
+
+        data = { header : np.concatenate([part[header] for part in parts]) for header in parts[0].keys() }
         data["region"] = np.full(data["p1"].size, region)
-        return data
+        return self._encode(data)
+
+
+    def parse_region_data(self, region:str, columns:Union[None, List[str]]=None) -> Dict[str, np.ndarray]:
+        return self.decode(self.parse_regions_data([region], columns=columns)[region])
+
+
+    @staticmethod
+    def _has_columns(data:Union[None, Dict[str, np.ndarray]], columns:List[str]) -> bool:
+        """Obsahují data kraje všechny požadované sloupce?"""
+        return data is not None and all(header in data for header in columns)
+
+
+    def _prepare_regions(self, regions:List[str], workers:Union[None, int]=None, columns:Union[None, List[str]]=None) -> None:
+        """Zajištění dat krajů (alespoň sloupců columns) v self.extracted_data (z paměti, z cache nebo zpracováním archivů)."""
+        columns = self._select_headers(columns)
+
+        #Extrahovaná data pro dané kraje nejsou v paměti (nebo jim chybí sloupce), načíst z cache jen požadované sloupce.
+        for region in regions:
+            if not self._has_columns(self.extracted_data[region], columns):
+                self.extracted_data[region] = self._load_cache(region, columns)
 
+        if not self.downloaded and any(self.extracted_data[region] is None for region in regions):
+            self.download_data()
 
-    def get_dict(self, regions:Union[None, List[str]]=None) -> Dict[str, np.ndarray]:
+        #Kraje bez cache (nebo bez požadovaných sloupců) zpracovat všemi archivy včetně dříve uložených sloupců,
+        #kraje s cache jen novými nebo změněnými archivy (pouze pokud byla data stažena, jinak se cache považuje
+        #za aktuální). Kraje se stejnými archivy a sloupci se zpracují společně.
+        pending : Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[str]] = {}
+        for region in regions:
+            cache_meta = self._read_cache_meta(region)
+            cached_columns = cache_meta["columns"] if cache_meta is not None else {}
+
+            if self.extracted_data[region] is None:
+                parse_columns = self._select_headers([*columns, *cached_columns])
+                pending.setdefault((tuple(self.downloaded_zips), tuple(parse_columns)), []).append(region)
+            elif self.downloaded and cache_meta is not None:
+                changed_zips = self._changed_archives(region)
+                if len(changed_zips) > 0:
+                    #Nové řádky se připojují ke všem sloupcům uloženým v cache.
+                    self.extracted_data[region] = self._load_cache(region)
+                    parse_columns = self._select_headers(list(cached_columns))
+                    pending.setdefault((tuple(changed_zips), tuple(parse_columns)), []).append(region)
+
+        for (zip_paths, parse_columns), pending_regions in pending.items():
+            self._update_regions(pending_regions, list(zip_paths), workers, list(parse_columns))
+
+
+    def get_dict(self, regions:Union[None, List[str]]=None, workers:Union[None, int]=None,
+                 columns:Union[None, List[str]]=None, filters:Union[None, Dict[str, Filter]]=None,
+                 decode:bool=True) -> Dict[str, np.ndarray]:
+        """Data zadaných krajů spojená do jednoho slovníku. Parametrem columns lze vybrat jen některé sloupce
+        (včetně "region"), ostatní sloupce se pak nepřevádí, nenačítají ani nekopírují.
+        S decode=False jsou sloupce vráceny v kompaktní podobě (viz _encode), jinak jako řetězce.
+
+        Parametrem filters lze vybrat jen řádky splňující podmínky na sloupce (viz _filter_mask), např.
+        { "p36" : [0, 1], "p44" : 3, "p2a" : ("2018-01-01", "2021-01-01") }. Podmínky se vyhodnocují nad sloupci
+        namapovanými z cache, kopírují se jen vybrané řádky. Kraje, jejichž cache dle uložených rozsahů hodnot
+        (min/max sloupců) podmínkám nemůže vyhovět, jsou přeskočeny celé."""
         if regions is None or len(regions) == 0:
             regions = list(self.regions.keys())
+        if filters is None:
+            filters = {}
 
-        data = self._create_empty_data_dict()
-        data["region"] = np.empty(shape=0, dtype=np.unicode_)
+        load_columns = None if columns is None else [*columns, *filters.keys()]
+        self._prepare_regions(regions, workers, load_columns)
 
+        data = self._create_empty_data_dict(columns)
+        if columns is None or "region" in columns:
+            data["region"] = np.empty(shape=0, dtype=np.unicode_)
+        data = self._encode(data)
+
+        #Masky vybraných řádků krajů, které mohou podmínkám vyhovět.
+        filters = self._encode_filters(filters)
+        masks = {}
         for region in regions:
-            self._print_message(f"Parsing data for {region} region...")
+            if len(filters) == 0:
+                masks[region] = slice(None)
+            elif self._may_match(region, filters):
+                masks[region] = self._filter_mask(self.extracted_data[region], filters)
 
-            #Extrahovaná data pro daný kraj nejsou v paměti, načíst z cache.
-            if self.extracted_data[region] is None:
-                filename = self.cache_file.format(region)
-                self.extracted_data[region] = self._load_cache(filename)
+        for header in data.keys():
+            data[header] = np.concatenate([data[header], *(self.extracted_data[region][header][mask]
+                for region, mask in masks.items())])
+        return self.decode(data) if decode else data
 
-                #Cache neexistuje, načíst metodou parse_region_data a uložit cache.
-                if self.extracted_data[region] is None:
-                    self.extracted_data[region] = self.parse_region_data(region)
-                    self._save_cache(filename, self.extracted_data[region])
 
-            for header in self.extracted_data[region].keys():
-                data[header] = np.concatenate((data[header], self.extracted_data[region][header]))
+    @staticmethod
+    def _filter_mask(data:Dict[str, np.ndarray], filters:Dict[str, Filter]) -> np.ndarray:
+        """Maska řádků splňujících všechny podmínky: skalár znamená rovnost, seznam/množina příslušnost
+        a dvojice (od, do) polouzavřený rozsah [od, do), kde None značí neomezenou mez (např. pro datum p2a).
+        Hodnoty podmínek musí být zakódovány stejně jako data (viz _encode_filters)."""
+        mask = np.ones(len(data["region"]), dtype=bool)
+        for header, condition in filters.items():
+            column = data[header]
+            if isinstance(condition, tuple):
+                low, high = condition
+                if low is not None:
+                    mask &= column >= low
+                if high is not None:
+                    mask &= column < high
+            elif isinstance(condition, (list, set, frozenset)):
+                mask &= np.isin(column, list(condition))
+            else:
+                mask &= column == condition
+        return mask
+
+
+    def _may_match(self, region:str, filters:Dict[str, Filter]) -> bool:
+        """Mohou data kraje podmínkám vyhovět? Rozhoduje se jen podle rozsahů hodnot uložených v metadatech cache."""
+        cache_meta = self._read_cache_meta(region)
+        stats = cache_meta.get("stats", {}) if cache_meta is not None else {}
+
+        for header, condition in filters.items():
+            if header not in stats:
+                continue
+            minimum, maximum = stats[header]
+            if header == "p2a":
+                minimum, maximum = np.datetime64(minimum), np.datetime64(maximum)
+            if isinstance(condition, tuple):
+                low, high = condition
+                if (low is not None and low > maximum) or (high is not None and high <= minimum):
+                    return False
+            elif isinstance(condition, (list, set, frozenset)):
+                if not any(minimum <= value <= maximum for value in condition):
+                    return False
+            elif not minimum <= condition <= maximum:
+                return False
+        return True
+
+
+    def iter_batches(self, regions:Union[None, List[str]]=None, batch_size:int=65536, workers:Union[None, int]=None,
+                     columns:Union[None, List[str]]=None, decode:bool=False) -> Iterator[Dict[str, np.ndarray]]:
+        """Postupné procházení dat krajů po dávkách o batch_size řádcích (poslední dávka může být menší).
+        Dávky jsou pohledy do dat krajů (načtených z cache namapované do paměti), data všech krajů tedy
+        nejsou nikdy spojena do jednoho slovníku. Kopírují se pouze dávky na hranici dvou krajů.
+        Parametrem columns lze vybrat jen některé sloupce (včetně "region"). Dávky jsou v kompaktní podobě
+        (viz _encode), s decode=True jsou řetězcové sloupce dekódovány (za cenu kopie každé dávky)."""
+        if regions is None or len(regions) == 0:
+            regions = list(self.regions.keys())
 
-            self._print_message(f"Done parsing data for {region} region...")
-        return data
+        self._prepare_regions(regions, workers, columns)
+        headers = list(self._create_empty_data_dict(columns).keys())
+        if columns is None or "region" in columns:
+            headers.append("region")
+
+        #Zbytek předchozího kraje, který nevyplnil celou dávku.
+        remainder : Union[None, Dict[str, np.ndarray]] = None
+        for region in regions:
+            region_data = { header : self.extracted_data[region][header] for header in headers }
+            start = 0
+            if remainder is not None:
+                start = batch_size - len(remainder[headers[0]])
+                remainder = { header : np.concatenate((remainder[header], column[:start])) for header, column in region_data.items() }
+                if len(remainder[headers[0]]) < batch_size:
+                    continue
+                yield self.decode(remainder) if decode else remainder
+                remainder = None
+
+            #Sloupec region je načten vždy (i z cache s vybranými sloupci), p1 být nemusí.
+            size = len(self.extracted_data[region]["region"])
+            for start in range(start, size, batch_size):
+                batch = { header : column[start:start + batch_size] for header, column in region_data.items() }
+                if start + batch_size > size:
+                    remainder = batch
+                    break
+                yield self.decode(batch) if decode else batch
+
+        if remainder is not None and len(remainder[headers[0]]) > 0:
+            yield self.decode(remainder) if decode else remainder
+
+
+    def _update_regions(self, regions:List[str], zip_paths:List[str], workers:Union[None, int]=None,
+                        columns:Union[None, List[str]]=None) -> None:
+        """Zpracování archivů zip_paths (jen sloupců columns) pro dané kraje, připojení nových řádků k datům z cache
+        a uložení cache."""
+        self._print_message(f"Parsing {len(zip_paths)} archives for {', '.join(regions)} regions...")
+
+        cached_data = { region : self.extracted_data[region] for region in regions if self.extracted_data[region] is not None }
+        seen_p1 = { region : data["p1"] for region, data in cached_data.items() }
+        for region, new_data in self.parse_regions_data(regions, workers, zip_paths, seen_p1, columns).items():
+            if region in cached_data:
+                new_data = { header : np.concatenate((cached_data[region][header], column)) for header, column in new_data.items() }
+            self.extracted_data[region] = new_data
+
+        #Zápis souborů uvolňuje GIL, ukládání krajů tedy běží paralelně ve vláknech bez kopírování dat.
+        with ThreadPool(min(workers or cpu_count(), len(regions))) as pool:
+            pool.starmap(self._save_cache, [ (region, self.extracted_data[region]) for region in regions ])
+        self._print_message(f"Done parsing data for {', '.join(regions)} regions...")
+
+
+    def _load_categories(self) -> Dict[str, np.ndarray]:
+        """Načtení slovníků kódovaných řetězcových sloupců (sdílené všemi cache ve složce)."""
+        if not exists(self.categories_file):
+            return {}
+
+        with open(self.categories_file, "r", encoding="utf-8") as file:
+            return { header : np.array(values, dtype=np.unicode_) for header, values in json.load(file).items() }
+
+
+    @contextmanager
+    def _categories_lock(self) -> Iterator[None]:
+        """Výhradní zámek souboru slovníků mezi instancemi a procesy používajícími stejnou složku."""
+        makedirs(self.folder, exist_ok=True)
+        with open(f"{self.categories_file}.lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+
+    def _save_categories(self) -> None:
+        """Uložení slovníků kódovaných řetězcových sloupců (jen pod zámkem, viz _extend_categories)."""
+        with open(f"{self.categories_file}.tmp", "w", encoding="utf-8") as file:
+            json.dump({ header : values.tolist() for header, values in self.categories.items() }, file, ensure_ascii=False)
+        replace(f"{self.categories_file}.tmp", self.categories_file)
+
+
+    def _extend_categories(self, header:str, values:List[str]) -> np.ndarray:
+        """Připojení hodnot na konec slovníku sloupce a jeho okamžité uložení, vrací aktuální slovník.
+        Pod zámkem se nejdříve načte soubor (mohla ho rozšířit jiná instance), slovníky se tak v souboru
+        pouze rozšiřují a kódy uložené kteroukoli instancí zůstávají platné."""
+        with self._categories_lock():
+            self.categories = self._load_categories()
+            table = self.categories.get(header, np.empty(shape=0, dtype=np.unicode_))
+            known = set(table.tolist())
+            new_values = [ value for value in values if value not in known ]
+            if len(new_values) > 0:
+                self.categories[header] = np.concatenate((table, np.array(new_values, dtype=np.unicode_)))
+                self._save_categories()
+        return self.categories.get(header, np.empty(shape=0, dtype=np.unicode_))
+
+
+    def _category_table(self, header:str, max_code:int=-1) -> np.ndarray:
+        """Slovník sloupce obsahující alespoň kódy do max_code (jinak se načte znovu ze souboru,
+        data mohla zakódovat jiná instance)."""
+        table = self.categories.get(header, np.empty(shape=0, dtype=np.unicode_))
+        if max_code >= len(table):
+            self.categories = self._load_categories()
+            table = self.categories.get(header, np.empty(shape=0, dtype=np.unicode_))
+        return table
+
+
+    def _encode_strings(self, header:str, column:np.ndarray) -> np.ndarray:
+        """Slovníkové kódování řetězcového sloupce. Slovník se pouze rozšiřuje o nové hodnoty na konec
+        a ukládá se dříve než data s novými kódy, kódy dříve uložených dat tedy zůstávají platné."""
+        table = self.categories.get(header, np.empty(shape=0, dtype=np.unicode_))
+        values, inverse = np.unique(column, return_inverse=True)
+
+        #Pozice hodnot ve slovníku, chybějící hodnoty se připojí na konec (i v souboru slovníků).
+        positions = { value : code for code, value in enumerate(table.tolist()) }
+        new_values = [ value for value in values.tolist() if value not in positions ]
+        if len(new_values) > 0:
+            table = self._extend_categories(header, new_values)
+            positions = { value : code for code, value in enumerate(table.tolist()) }
+
+        codes = np.array([ positions[value] for value in values.tolist() ], dtype=np.uint32)
+        return codes[inverse].astype(np.uint32)
+
+
+    def _encode(self, data:Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Převod sloupců na kompaktní reprezentaci: p2a na datetime64[D], region na kód kraje (uint8, index do regions)
+        a ostatní řetězcové sloupce na kódy do slovníku self.categories (uint32). Již kódované sloupce se nemění."""
+        encoded = dict(data)
+        for header, column in data.items():
+            if column.dtype.kind != "U":
+                continue
+            if header == "p2a":
+                encoded[header] = column.astype("datetime64[D]")
+            elif header == "region":
+                encoded[header] = np.searchsorted(self.region_codes, column).astype(np.uint8)
+            else:
+                encoded[header] = self._encode_strings(header, column)
+        return encoded
+
+
+    def decode(self, data:Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Převod kompaktní reprezentace sloupců (viz _encode) zpět na řetězce."""
+        decoded = dict(data)
+        for header, column in data.items():
+            if header == "p2a" and column.dtype.kind == "M":
+                decoded[header] = column.astype("<U10")
+            elif header == "region" and column.dtype.kind == "u":
+                decoded[header] = self.region_codes[column]
+            elif self.header_types.get(header) is np.unicode_ and column.dtype.kind == "u":
+                table = self._category_table(header, int(column.max(initial=-1)))
+                decoded[header] = table[column]
+        return decoded
+
+
+    def _encode_value(self, header:str, value:Union[int, float, str, None]) -> Union[int, float, np.datetime64, None]:
+        """Zakódování hodnoty podmínky filtru stejně jako data sloupce (neznámý řetězec nevyhovuje žádnému řádku)."""
+        if value is None or not isinstance(value, str):
+            return value
+        if header == "p2a":
+            return np.datetime64(value, "D")
+        if header == "region":
+            return self.region_codes.tolist().index(value) if value in self.regions else -1
+        table = self._category_table(header)
+        if value not in table:
+            #Hodnotu mohla do slovníku přidat jiná instance.
+            table = self._category_table(header, len(table))
+        if value in table:
+            return int(np.flatnonzero(table == value)[0])
+        return -1
+
+
+    def _encode_filters(self, filters:Dict[str, Filter]) -> Dict[str, Filter]:
+        """Zakódování hodnot podmínek filtrů (viz _encode_value)."""
+        encoded = {}
+        for header, condition in filters.items():
+            if isinstance(condition, (tuple, list, set, frozenset)):
+                encoded[header] = type(condition)(self._encode_value(header, value) for value in condition)
+            else:
+                encoded[header] = self._encode_value(header, condition)
+        return encoded
 
 
     @staticmethod
-    def _load_cache(filename:str) -> Union[Dict[str, np.ndarray], None]:
-        """Načtení dat z cache souboru, pokud existuje, jinak None."""
+    def _archive_info(zip_path:str) -> Dict[str, Union[str, int]]:
+        """Identifikace archivu pro cache: cesta, velikost a čas poslední změny."""
+        stats = stat(zip_path)
+        return { "path" : zip_path, "size" : stats.st_size, "mtime" : stats.st_mtime_ns }
+
+
+    def _changed_archives(self, region:str) -> List[str]:
+        """Seznam stažených archivů, které v cache kraje chybí nebo se od jejího vytvoření změnily."""
+        cached_archives = self._read_cache_meta(region).get("archives", [])
+        return [ zip_path for zip_path in self.downloaded_zips if self._archive_info(zip_path) not in cached_archives ]
+
+
+    def _read_cache_meta(self, region:str) -> Union[Dict, None]:
+        """Načtení metadat cache kraje, pokud existuje, jinak None."""
+        filename = f"{self.cache_dir.format(region)}/meta.json"
         if not exists(filename):
             return None
 
-        with gzip.open(filename, "rb") as file:
-            return pickle.load(file)
+        with open(filename, "r") as file:
+            return json.load(file)
+
+
+    def _load_cache(self, region:str, columns:Union[None, List[str]]=None) -> Union[Dict[str, np.ndarray], None]:
+        """Načtení dat kraje (jen sloupců columns a sloupce region, None znamená všechny uložené) z cache,
+        pokud existuje a obsahuje všechny požadované sloupce, jinak None.
+        Sloupce jsou namapovány do paměti (np.memmap) jen pro čtení, nic se nekopíruje ani nedekomprimuje.
+        Původní cache ve formátu gzip pickle je automaticky převedena na nový formát."""
+        meta = self._read_cache_meta(region)
+        if meta is None:
+            return self._migrate_cache(region, columns)
+
+        headers = list(meta["columns"]) if columns is None else [*columns, "region"]
+        if any(header not in meta["columns"] for header in headers):
+            return None
+
+        dirname = self.cache_dir.format(region)
+
+        #Starší cache s řetězcovými sloupci převést na kompaktní reprezentaci.
+        if any(np.dtype(dtype).kind == "U" for dtype in meta["columns"].values()):
+            self._print_message(f"Migrating cache {dirname}...")
+            self._save_cache(region, self._encode({ header : np.load(f"{dirname}/{header}.npy") for header in meta["columns"] }),
+                             meta.get("archives", []))
+            return self._load_cache(region, columns)
+
+        return { header : np.load(f"{dirname}/{header}.npy", mmap_mode="r") for header in headers }
+
+
+    def _save_cache(self, region:str, data:Dict[str, np.ndarray], archives:Union[None, List[Dict]]=None) -> None:
+        """Uložení dat kraje do cache: jeden nekomprimovaný .npy soubor na sloupec a metadata v meta.json
+        (včetně seznamu zpracovaných archivů, výchozí jsou aktuálně stažené archivy). Spolu s daty se ukládají
+        i agregační kostky (viz _save_cubes). Metadata se zapisují jako poslední, cache bez nich je považována
+        za neúplnou. Soubory se nahrazují přejmenováním, takže již namapované sloupce původní cache zůstávají platné."""
+        dirname = self.cache_dir.format(region)
+        makedirs(dirname, exist_ok=True)
+
+        for header, column in data.items():
+            with open(f"{dirname}/{header}.npy.tmp", "wb") as file:
+                np.save(file, column)
+            replace(f"{dirname}/{header}.npy.tmp", f"{dirname}/{header}.npy")
+
+        self._save_cubes(region, data)
+
+        meta = {
+            "rows" : len(data["p1"]),
+            "columns" : { header : column.dtype.str for header, column in data.items() },
+            "stats" : { header : self._column_range(column) for header, column in data.items()
+                if len(column) > 0 and column.dtype.kind in "iuM" },
+            "archives" : archives if archives is not None else
+                [ self._archive_info(zip_path) for zip_path in self.downloaded_zips ] if self.downloaded else [],
+        }
+        with open(f"{dirname}/meta.json.tmp", "w") as file:
+            json.dump(meta, file)
+        replace(f"{dirname}/meta.json.tmp", f"{dirname}/meta.json")
+
+
+    @classmethod
+    def _cube_columns(cls, columns:Iterable[str]) -> List[str]:
+        """Sloupce s malým počtem hodnot (kódy p* typu uint8), pro které se předpočítávají agregační kostky."""
+        return [ header for header in cls._select_headers(list(columns))
+            if header.startswith("p") and cls.header_types[header] is np.uint8 ]
+
+
+    def _save_cubes(self, region:str, data:Dict[str, np.ndarray], columns:Union[None, List[str]]=None) -> None:
+        """Výpočet a uložení agregačních kostek kraje: počty nehod měsíc × hodnota sloupce pro každý sloupec
+        z _cube_columns (columns, výchozí všechny dostupné). Každá kostka v cube_{sloupec}.npz obsahuje
+        pole months (datetime64[M]) a counts (tvar měsíce × hodnoty)."""
+        if "p2a" not in data:
+            return
+
+        dirname = self.cache_dir.format(region)
+        months = np.asarray(data["p2a"]).astype("datetime64[M]")
+        first_month = months.min() if len(months) > 0 else np.datetime64("1970-01", "M")
+        month_codes = (months - first_month).astype(np.intp)
+        month_labels = np.arange(first_month, first_month + month_codes.max(initial=-1) + 1)
+
+        for header in self._cube_columns(data.keys() if columns is None else columns):
+            shape = (len(month_labels), int(np.max(data[header], initial=0)) + 1)
+            counts = crosstab(month_codes, data[header], shape).astype(np.uint32)
+            with open(f"{dirname}/cube_{header}.npz.tmp", "wb") as file:
+                np.savez(file, months=month_labels, counts=counts)
+            replace(f"{dirname}/cube_{header}.npz.tmp", f"{dirname}/cube_{header}.npz")
+
+
+    def _load_cube(self, region:str, column:str) -> Union[Tuple[np.ndarray, np.ndarray], None]:
+        """Načtení agregační kostky kraje pro sloupec (měsíce, počty), pokud existuje, jinak None."""
+        filename = f"{self.cache_dir.format(region)}/cube_{column}.npz"
+        if not exists(filename):
+            return None
+
+        with np.load(filename) as cube:
+            return cube["months"], cube["counts"]
+
+
+    def get_counts(self, column:str, regions:Union[None, List[str]]=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Počty nehod kraj × měsíc × hodnota sloupce (p* s malým počtem hodnot, viz _cube_columns)
+        z předpočítaných agregačních kostek, bez čtení řádkových dat.
+        Vrací pole měsíců (datetime64[M], společný rozsah všech krajů) a počty tvaru (kraje, měsíce, hodnoty)."""
+        if regions is None or len(regions) == 0:
+            regions = list(self.regions.keys())
+        if column not in self._cube_columns([column]):
+            raise ValueError(f"Column {column} has no precomputed counts")
+
+        #Po stažení nových dat nejdříve aktualizovat cache (a s ní i kostky).
+        if self.downloaded:
+            self._prepare_regions(regions, columns=["p2a", column])
+
+        cubes = {}
+        for region in regions:
+            cubes[region] = self._load_cube(region, column)
+            if cubes[region] is None:
+                #Kostka chybí (např. starší cache), vypočítat z dat kraje.
+                self._prepare_regions([region], columns=["p2a", column])
+                self._save_cubes(region, self.extracted_data[region], [column])
+                cubes[region] = self._load_cube(region, column)
+
+        #Sjednocení rozsahů měsíců a hodnot všech krajů.
+        month_ranges = [ months[[0, -1]] for months, _ in cubes.values() if len(months) > 0 ]
+        if len(month_ranges) > 0:
+            month_ranges = np.concatenate(month_ranges)
+            months = np.arange(month_ranges.min(), month_ranges.max() + 1)
+        else:
+            months = np.empty(shape=0, dtype="datetime64[M]")
+        values = max((counts.shape[1] for _, counts in cubes.values()), default=0)
+
+        result = np.zeros((len(regions), len(months), values), dtype=np.uint32)
+        for i, (region_months, counts) in enumerate(cubes.values()):
+            if len(region_months) > 0:
+                start = int((region_months[0] - months[0]).astype(int))
+                result[i, start:start + len(region_months), :counts.shape[1]] = counts
+        return months, result
 
 
     @staticmethod
-    def _save_cache(filename:str, data:Dict[str, np.ndarray]) -> None:
-        """Uložení dat do cache souboru."""
-        with gzip.open(filename, "wb") as file:
-            pickle.dump(data, file)
+    def _column_range(column:np.ndarray) -> List[Union[int, str]]:
+        """Minimální a maximální hodnota sloupce pro přeskakování cache při filtrování (datum jako řetězec)."""
+        if column.dtype.kind == "M":
+            return [str(column.min()), str(column.max())]
+        return [column.min().item(), column.max().item()]
+
+
+    def _migrate_cache(self, region:str, columns:Union[None, List[str]]=None) -> Union[Dict[str, np.ndarray], None]:
+        """Převod původní cache (gzip pickle) kraje na sloupcový formát, pokud existuje, jinak None."""
+        filename = self.cache_file.format(region)
+        if not exists(filename):
+            return None
+
+        self._print_message(f"Migrating cache {filename}...")
+        with gzip.open(filename, "rb") as file:
+            self._save_cache(region, self._encode(pickle.load(file)), [])
+        remove(filename)
+        return self._load_cache(region, columns)
 
 
     @staticmethod
@@ -1,40 +1,39 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 #%%
+import sys
 from argparse import ArgumentParser
 from os import makedirs
+from os.path import abspath, dirname, join
 from typing import Dict
 
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import colors
 
+from crosstab import crosstab
 from download import DataDownloader
 
+#Sdílené tabulky popisků (labels.py v kořeni projektu).
+sys.path.append(join(dirname(abspath(__file__)), ".."))
+from labels import P24_LABELS
+
 # povolene jsou pouze zakladni knihovny (os, sys) a knihovny numpy, matplotlib a argparse
-#%%
-P24_LABELS = [
-    "Žádná úprava",
-    "Přerušovaná žlutá",
-    "Semafor mimo provoz",
-    "Dopravní značky",
-    "Přenosné dopravní značky",
-    "Nevyznačena",
-]
 
 #%%
 def plot_stat(data_source:Dict[str, np.ndarray], fig_location:str=None, show_figure:bool=False) -> None:
-    regions = np.unique(data_source["region"])
+    #Kódy krajů: kompaktní sloupec region (DataDownloader.get_dict(decode=False)) nebo řetězce.
+    if data_source["region"].dtype.kind == "u":
+        regions, region_codes = DataDownloader.region_codes, data_source["region"]
+    else:
+        regions, region_codes = np.unique(data_source["region"], return_inverse=True)
     p24_size = len(P24_LABELS)
-    stats_abs = np.empty((p24_size, regions.size))
-    stats_rel = np.empty_like(stats_abs)
 
-    #Uložit statistiky (počty hodnot ve sloupci p24) pro každý region.
-    for i, region in enumerate(regions):
-        indeces = np.argwhere(data_source["region"] == region).flatten()
-        counts = np.bincount(data_source["p24"][indeces], minlength=p24_size)
-        stats_abs[:, i] = counts
-        stats_rel[:, i] = (counts / counts.sum()) * 100
+    #Statistiky (počty hodnot ve sloupci p24) pro všechny regiony jedním průchodem, jen regiony obsažené v datech.
+    stats_abs = crosstab(data_source["p24"], region_codes, shape=(p24_size, regions.size)).astype(np.double)
+    present = stats_abs.sum(axis=0) > 0
+    regions, stats_abs = regions[present], stats_abs[:, present]
+    stats_rel = (stats_abs / stats_abs.sum(axis=0)) * 100
 
     #Vytvořit graf.
     fig, axs = plt.subplots(2, 1, figsize=(6, 6))
@@ -84,7 +83,7 @@ def main() -> None:
     parser.add_argument('--show_figure', action="store_true", help='Show figure')
     args = parser.parse_args()
 #%%
-    data_source = DataDownloader().get_dict()
+    data_source = DataDownloader().get_dict(columns=["region", "p24"], decode=False)
 #%%
     plot_stat(data_source, args.fig_location, args.show_figure)
 #%%
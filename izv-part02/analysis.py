@@ -1,11 +1,20 @@
 #!/usr/bin/env python3.9
 # coding=utf-8
 # %%
-from typing import List
+import os
+import sys
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple, Union
 from matplotlib import pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
 
+# Shared code -> label tables (labels.py in the project root)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from labels import (P10_DEFAULT, P10_LABELS, P18_DEFAULT,  # noqa: E402
+                    P18_LABELS, P21_DEFAULT, P21_LABELS)
+
 # muzete pridat libovolnou zakladni knihovnu ci knihovnu predstavenou na prednaskach
 # dalsi knihovny pak na dotaz
 
@@ -24,56 +33,267 @@ Poznámka: zobrazujte na 1 desetinné místo (.1f) a počítejte, že 1 MB = 1e6
 # %%
 
 
-def get_dataframe(filename: str, verbose: bool = False) -> pd.DataFrame:
-    df = pd.read_pickle(filename)
+# Columns kept in their original dtype, every other column becomes categorical
+KEEP_DTYPE_COLUMNS = ["region"]
 
-    # Add date column
-    df["date"] = pd.to_datetime(df["p2a"], format="%Y-%m-%d")
-    if verbose:
-        print(f"orig_size={df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
 
-    # Convert each col in df to categorical
+def _compact_filename(filename: str) -> str:
+    """Return path of the persisted converted frame for filename."""
+    return filename.replace(".pkl.gz", "") + ".compact.pkl"
+
+
+def _convert_column(col: str, series: pd.Series) -> pd.Series:
+    """Convert a single column according to the dtype plan."""
+    if col in KEEP_DTYPE_COLUMNS:
+        return series
+    return series.astype("category")
+
+
+def _data_size(df: pd.DataFrame) -> int:
+    """Return deep size of data of df in bytes (new_size).
+
+    Categorical columns count their codes and category values only, not the
+    lookup tables pandas builds lazily, so the size does not depend on
+    whether the frame was just converted or loaded from the cache.
+    """
+    sizes = df.memory_usage(index=True, deep=True)
     for col in df.columns:
-        if col not in ["region", "date"]:
-            df[col] = df[col].astype("category")
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            values = df[col].array
+            categories = pd.Series(values.categories.to_numpy(), copy=False)
+            sizes[col] = (values.codes.nbytes +
+                          categories.memory_usage(index=False, deep=True))
+    return int(sizes.sum())
+
+
+def get_dataframe(filename: str, verbose: bool = False,
+                  use_cache: bool = True) -> pd.DataFrame:
+    compact_filename = _compact_filename(filename)
+
+    # Converted frame is persisted next to the source, reuse it if up to date
+    if (use_cache and os.path.exists(compact_filename) and
+            os.path.getmtime(compact_filename) >= os.path.getmtime(filename)):
+        df = pd.read_pickle(compact_filename)
+    else:
+        src = pd.read_pickle(filename)
+        date = pd.to_datetime(src["p2a"], format="%Y-%m-%d")
+
+        # Size of the source frame with the date column (orig_size), measured
+        # before conversion as hashing strings caches their UTF-8 copies
+        orig_size = int(src.memory_usage(deep=True).sum() +
+                        date.memory_usage(index=False))
+
+        # Build the compact frame column by column (each source column is
+        # converted once and dropped), date column is added as the last one
+        index = src.index
+        columns = {}
+        for col in list(src.columns):
+            columns[col] = _convert_column(col, src.pop(col))
+        columns["date"] = date
+        del src
+        df = pd.DataFrame(columns, index=index, copy=False)
+        df.attrs["orig_size"] = orig_size
+        del columns
+
+        if use_cache:
+            tmp_filename = compact_filename + ".tmp"
+            df.to_pickle(tmp_filename, compression=None, protocol=5)
+            os.replace(tmp_filename, compact_filename)
+
     if verbose:
-        print(f"new_size={df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+        print(f"orig_size={df.attrs['orig_size'] / 1e6:.1f} MB")
+        print(f"new_size={_data_size(df) / 1e6:.1f} MB")
 
     return df
 
 # %%
 
 
-def _selected_regions(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
-    """Return a copy of df from 4 selected regions witg specified columns."""
-    return df[columns][df["region"].isin(["MSK", "JHM", "VYS", "JHC"])].copy()
+SELECTED_REGIONS = ("MSK", "JHM", "VYS", "JHC")
+
+# Time bucket granularities -> pandas period frequencies
+PERIOD_FREQS = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+
+
+class _ResultCache:
+    """LRU cache of intermediate query results with a memory cap in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._items: "OrderedDict[Hashable, Tuple[object, int]]" = \
+            OrderedDict()
+
+    @staticmethod
+    def _size(value: Union[pd.Series, np.ndarray]) -> int:
+        if isinstance(value, pd.Series):
+            return int(value.memory_usage(index=True, deep=False))
+        return int(value.nbytes)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+        value = compute()
+        size = self._size(value)
+        if size <= self.max_bytes:
+            # Evict least recently used results to stay under the cap
+            while self.used_bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.used_bytes -= evicted_size
+            self._items[key] = (value, size)
+            self.used_bytes += size
+        return value
+
+
+class LazyAccidents:
+    """Lazy query over the accidents frame.
+
+    A query records a region filter, columns are projected only when
+    requested. Every subexpression (region mask, filtered columns, derived
+    columns such as month) is evaluated once and shared by all queries
+    derived from this one through a cache with a memory cap. Cached results
+    are never invalidated, create a new query after modifying the frame.
+    """
+
+    # Derived columns computed from already filtered columns of the query
+    DERIVED: Dict[str, Callable[["LazyAccidents"], pd.Series]] = {
+        "year": lambda query: query.column("date").dt.year,
+        "month": lambda query: query.column("date").dt.month,
+        # Time buckets (period_D, period_W, period_M, period_Y)
+        **{f"period_{freq}": (lambda query, freq=freq:
+                              query.column("date").dt.to_period(freq))
+           for freq in PERIOD_FREQS.values()},
+    }
+
+    def __init__(self, df: pd.DataFrame, max_cache_bytes: int = 256 * 10**6,
+                 regions: Optional[Tuple[str, ...]] = None,
+                 cache: Optional[_ResultCache] = None):
+        self.df = df
+        self.regions = regions
+        self.cache = cache if cache is not None else \
+            _ResultCache(max_cache_bytes)
+
+    def select_regions(self, regions: Tuple[str, ...]) -> "LazyAccidents":
+        """Return a query restricted to regions sharing this query's cache."""
+        return LazyAccidents(self.df, regions=tuple(regions), cache=self.cache)
+
+    def _mask(self) -> np.ndarray:
+        return self.cache.get_or_compute(
+            ("mask", self.regions),
+            lambda: self.df["region"].isin(self.regions).to_numpy())
+
+    def _compute_column(self, col: str) -> pd.Series:
+        if col in self.DERIVED:
+            return self.DERIVED[col](self)
+        if self.regions is None:
+            return self.df[col]
+        return self.df[col][self._mask()]
+
+    def column(self, col: str) -> pd.Series:
+        """Return a single (filtered or derived) column of the query."""
+        return self.cache.get_or_compute((self.regions, col),
+                                         lambda: self._compute_column(col))
+
+    def __getitem__(self, columns: List[str]) -> pd.DataFrame:
+        """Collect projection of the query into a new frame.
+
+        Columns of the frame share data with the cache, replace whole columns
+        instead of modifying them in place.
+        """
+        return pd.DataFrame({col: self.column(col) for col in columns},
+                            copy=False)
+
+
+def lazy(df: Union[pd.DataFrame, LazyAccidents]) -> LazyAccidents:
+    """Return df if it is a query, otherwise a new query over df.
+
+    Results are shared between calls only through a query created and
+    passed by the caller, a plain frame gets a fresh cache on every call.
+    """
+    if isinstance(df, LazyAccidents):
+        return df
+    return LazyAccidents(df)
+
+
+def _selected_regions(df: Union[pd.DataFrame, LazyAccidents],
+                      columns: List[str]) -> pd.DataFrame:
+    """Return df from 4 selected regions with specified columns."""
+    return lazy(df).select_regions(SELECTED_REGIONS)[columns]
+
+
+def bucket_counts(df: pd.DataFrame, bucket: str,
+                  by: List[str]) -> pd.DataFrame:
+    """Count rows of df per value of bucket column and by columns.
+
+    Counts are computed by a single groupby, result is indexed by the bucket
+    with one column for every observed combination of by values (missing
+    combinations are 0).
+    """
+    counts = df.groupby([bucket, *by], observed=True).size()
+    return counts.unstack(by, fill_value=0)
+
+
+def period_counts(df: Union[pd.DataFrame, LazyAccidents], period: str,
+                  by: List[str], start: Optional[str] = None,
+                  end: Optional[str] = None,
+                  regions: Tuple[str, ...] = SELECTED_REGIONS) -> pd.DataFrame:
+    """Count accidents of regions per time bucket and by columns.
+
+    period is one of PERIOD_FREQS (day, week, month, year), buckets between
+    start (inclusive) and end (exclusive) are kept. Result is indexed by all
+    periods of the covered range including empty ones.
+    """
+    freq = PERIOD_FREQS[period]
+    column = f"period_{freq}"
+    df_period = lazy(df).select_regions(regions)[[column, *by]]
+
+    mask = np.ones(len(df_period), dtype=bool)
+    if start is not None:
+        mask &= (df_period[column] >= pd.Period(start, freq)).to_numpy()
+    if end is not None:
+        mask &= (df_period[column] < pd.Period(end, freq)).to_numpy()
+    counts = bucket_counts(df_period[mask], column, by)
+
+    if counts.empty:
+        return counts
+    index = pd.period_range(counts.index.min(), counts.index.max(), freq=freq)
+    return counts.reindex(index, fill_value=0)
+
+
+def _relabel(series: pd.Series, labels: Dict[int, str],
+             default: str) -> pd.Series:
+    """Map codes in series to labels (codes missing in labels get default).
+
+    Only the distinct codes (categories) are looked up in the table, rows are
+    relabeled by a single vectorized take. Result is categorical, categories
+    keep the code order if labels are unique, otherwise they are sorted
+    (same ordering of groups as with Series.map).
+    """
+    series = series.astype("category")
+    names = [labels.get(code, default) for code in series.cat.categories]
+    unique_names = pd.unique(np.array(names, dtype=object))
+    categories = pd.Index(unique_names if len(unique_names) == len(names)
+                          else sorted(unique_names))
+
+    # Position of the label of each old category, missing values stay -1
+    positions = np.append(categories.get_indexer(names), -1)
+    codes = positions[series.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories),
+                     index=series.index, name=series.name)
 
 # %%
 # Ukol 2: počty nehod v jednotlivých regionech podle druhu silnic
 
 
-def _map_roadtype(p21_value: int) -> str:
-    if p21_value == 1:
-        return "Dvoupruhová komunikace"
-    elif p21_value == 2:
-        return "Třípruhová komunikace"
-    elif p21_value == 3 or p21_value == 4:
-        return "Čtyřpruhová komunikace"
-    elif p21_value == 5:
-        return "Vícepruhová komunikace"
-    elif p21_value == 6:
-        return "Rychlostní komunikace"
-    else:
-        return "Jiná komunikace"
-
-
-def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
-                  show_figure: bool = False):
-    # Create a copy of df with only selected columns
+def plot_roadtype(df: Union[pd.DataFrame, LazyAccidents],
+                  fig_location: str = None, show_figure: bool = False):
+    # Select rows of 4 regions with only selected columns
     df_roadtype = _selected_regions(df, columns=["region", "p21"])
 
     # Modify p21 column to map labels
-    df_roadtype["p21"] = df_roadtype["p21"].map(_map_roadtype)
+    df_roadtype["p21"] = _relabel(df_roadtype["p21"], P21_LABELS, P21_DEFAULT)
 
     # Create subplots for 6 road types
     fig, axes = plt.subplots(3, 2, figsize=(10, 10))
@@ -82,7 +302,8 @@ def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
     axes = axes.flatten()
 
     # For each road type, plot count of accidents in regions using seaborn
-    for index, (road_type, group) in enumerate(df_roadtype.groupby("p21")):
+    for index, (road_type, group) in enumerate(
+            df_roadtype.groupby("p21", observed=True)):
         ax = axes[index]
         sns.countplot(x="region", data=group, ax=ax, hue="region")
 
@@ -103,29 +324,21 @@ def plot_roadtype(df: pd.DataFrame, fig_location: str = None,
 # Ukol3: zavinění zvěří
 
 
-def _map_animal(p10_value: int) -> str:
-    if p10_value == 1 or p10_value == 2:
-        return "řidičem"
-    elif p10_value == 4:
-        return "zvěří"
-    else:
-        return "jiné"
-
-
-def plot_animals(df: pd.DataFrame, fig_location: str = None,
-                 show_figure: bool = False):
-    # Create a copy of df with only selected columns
-    df_animals = _selected_regions(df, columns=["region", "date", "p10"])
+def plot_animals(df: Union[pd.DataFrame, LazyAccidents],
+                 fig_location: str = None, show_figure: bool = False):
+    # Select columns, year and month are shared with other plots
+    df_animals = _selected_regions(df, columns=["region", "year", "month",
+                                                "p10"])
 
     # Remove rows with date year == 2021
-    df_animals = df_animals[df_animals["date"].dt.year != 2021]
+    df_animals = df_animals[df_animals["year"] != 2021]
 
-    # Modify p10 column to map labels and date to months
-    df_animals["p10"] = df_animals["p10"].map(_map_animal)
-    df_animals["date"] = df_animals["date"].dt.month
+    # Modify p10 column to map labels
+    df_animals["p10"] = _relabel(df_animals["p10"], P10_LABELS, P10_DEFAULT)
 
-    # Sort by p10
-    df_animals.sort_values(by=["p10", "region"], inplace=True, ascending=False)
+    # Count accidents by region, month and p10 at once
+    counts = bucket_counts(df_animals, "month", ["region", "p10"])
+    p10_order = df_animals["p10"].cat.categories[::-1]
 
     # Create subplots for 4 regions
     fig, axes = plt.subplots(2, 2, figsize=(12, 9))
@@ -133,9 +346,15 @@ def plot_animals(df: pd.DataFrame, fig_location: str = None,
     axes = axes.flatten()
 
     # For each region, plot animal type in accident by month using seaborn
-    for index, (region, group) in enumerate(df_animals.groupby("region")):
+    for index, region in enumerate(sorted(counts.columns.unique("region"))):
+        group = counts[region].stack().rename("count").reset_index()
+        group = group[group["count"] > 0]
+        present = set(group["p10"])
+
         ax = axes[index]
-        sns.countplot(x="date", data=group, ax=ax, hue="p10")
+        sns.barplot(x="month", y="count", data=group, ax=ax, hue="p10",
+                    hue_order=[label for label in p10_order
+                               if label in present])
 
         ax.set_title(f"Kraj: {region}")
         ax.set_ylabel("Počet nehod")
@@ -155,50 +374,30 @@ def plot_animals(df: pd.DataFrame, fig_location: str = None,
 # Ukol 4: Povětrnostní podmínky
 
 
-def _map_condition(p18_value: int) -> str:
-    if p18_value == 1:
-        return "neztižené"
-    elif p18_value == 2:
-        return "mlha"
-    elif p18_value == 3:
-        return "na počátku deště"
-    elif p18_value == 4:
-        return "déšť"
-    elif p18_value == 5:
-        return "sněžení"
-    elif p18_value == 6:
-        return "náledí"
-    elif p18_value == 7:
-        return "nárazový vítr"
-    else:
-        return "jiné"
-
-
-def plot_conditions(df: pd.DataFrame, fig_location: str = None,
-                    show_figure: bool = False):
-    # Create a copy of df with only selected columns
-    df_conditions = _selected_regions(df, columns=["region", "date", "p18"])
-
-    # Reduce dataset to contain dates between 1.1.2016 and 1.1.2020
-    df_conditions = df_conditions[(df_conditions["date"] >= "2016-01-01") &
-                                  (df_conditions["date"] < "2020-01-01")]
+def plot_conditions(df: Union[pd.DataFrame, LazyAccidents],
+                    fig_location: str = None, show_figure: bool = False):
+    # Monthly counts of accidents by region and p18 between 1.1.2016 and
+    # 1.1.2020 (one groupby over the month period column)
+    counts = period_counts(df, "month", ["region", "p18"],
+                           start="2016-01", end="2020-01")
 
-    # Modify p18 column to map labels
-    df_conditions["p18"] = df_conditions["p18"].map(_map_condition)
+    # Modify p18 level of columns to map labels (merged labels are summed)
+    labels = _relabel(counts.columns.get_level_values("p18").to_series(),
+                      P18_LABELS, P18_DEFAULT)
+    counts = counts.T.groupby([counts.columns.get_level_values("region"),
+                               labels.array], observed=True).sum().T
 
     # For each region, plot count of accidents by p18 using seaborn lineplot
     fig, axes = plt.subplots(2, 2, figsize=(12, 9))
     fig.set_facecolor("#fefefe")
     axes = axes.flatten()
 
-    for index, (region, group) in enumerate(df_conditions.groupby("region")):
-        group = group.pivot_table(index="date", columns="p18",
-                                  values="region", aggfunc="count")
+    for index, region in enumerate(sorted(counts.columns.unique(0))):
         # Remove column where p18 == 0
-        group = group.drop(columns="jiné", axis=1)
+        group = counts[region].drop(columns="jiné")
 
-        # Reduce date to month level
-        group = group.resample("M").sum()
+        # Index months by their last day
+        group.index = group.index.to_timestamp(how="end").normalize()
 
         # Plot group to lineplot
         ax = axes[index]
@@ -230,10 +429,12 @@ if __name__ == "__main__":
     # funkce.
     # %%
     df = get_dataframe("accidents.pkl.gz", verbose=True)
+    # Shared query, region mask and date columns are computed once
+    accidents = LazyAccidents(df)
     # %%
-    plot_roadtype(df, fig_location="01_roadtype.png", show_figure=True)
+    plot_roadtype(accidents, fig_location="01_roadtype.png", show_figure=True)
     # %%
-    plot_animals(df, "02_animals.png", True)
+    plot_animals(accidents, "02_animals.png", True)
     # %%
-    plot_conditions(df, "03_conditions.png", True)
+    plot_conditions(accidents, "03_conditions.png", True)
     # %%
@@ -0,0 +1,67 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+# Porovnání shlukování v plot_cluster: přesné Complete-linkage ("exact")
+# a shlukování těžišť buněk mřížky ("grid"), čas, paměť a shoda shluků.
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+
+from geo import N_CLUSTERS, REGION, cluster_points, load_geo
+
+
+def synthetic_points(n: int, seed: int = 0) -> np.ndarray:
+    """ n bodů v rozsahu S-JTSK pro ČR, soustředěných kolem náhodných center
+    (podobně jako nehody podél silnic a ve městech). """
+
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(-900000, -430000, 500),
+                               rng.uniform(-1230000, -935000, 500)])
+    points = centers[rng.integers(0, len(centers), n)]
+    return points + rng.normal(0, 3000, (n, 2))
+
+
+def measure(points: np.ndarray, method: str) -> tuple:
+    """ Shlukování bodů metodou method, vrací (čísla shluků, čas [s],
+    nejvyšší alokovaná paměť [MB]). """
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    labels = cluster_points(points[:, 0], points[:, 1], N_CLUSTERS, method)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return labels, elapsed, peak
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--filename", type=str, default="accidents.pkl.gz",
+                        help="Accidents file (points of REGION on first-class roads)")
+    parser.add_argument("--points", type=int, nargs="+", default=None,
+                        help="Numbers of synthetic points instead of the accidents file")
+    parser.add_argument("--exact-limit", type=int, default=20000,
+                        help="Largest number of points clustered by the exact method")
+    args = parser.parse_args()
+
+    if args.points is None:
+        gdf = load_geo(args.filename)
+        gdf = gdf[(gdf["region"] == REGION) & (gdf["p36"] == 1)]
+        datasets = [gdf[["x_5514", "y_5514"]].to_numpy()]
+    else:
+        datasets = [synthetic_points(n) for n in args.points]
+
+    for points in datasets:
+        grid_labels, grid_time, grid_peak = measure(points, "grid")
+        print(f"{len(points)} bodů: grid {grid_time:.2f} s, {grid_peak:.1f} MB")
+
+        if len(points) <= args.exact_limit:
+            labels, exact_time, exact_peak = measure(points, "exact")
+            print(f"{len(points)} bodů: exact {exact_time:.2f} s, {exact_peak:.1f} MB, "
+                  f"shoda (ARI) {adjusted_rand_score(labels, grid_labels):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+# Průběžné statistiky hodnot podle celočíselného kódu skupiny (např. škoda
+# p53 podle výrobní značky p45a) počítané po dávkách v jednom průchodu:
+# počet, průměr, rozptyl a přibližné kvantily (logaritmický histogram).
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Poměr sousedních hranic přihrádek histogramu pro kvantily,
+# relativní chyba kvantilu je nejvýše (gamma - 1) / (gamma + 1), tj. ~1 %
+SKETCH_GAMMA = 1.02
+
+# Počet přihrádek histogramu (hodnoty do SKETCH_GAMMA ** SKETCH_BUCKETS ~ 1e10)
+SKETCH_BUCKETS = 1200
+
+
+class GroupStats:
+    """ Statistiky hodnot po skupinách daných nezápornými kódy, pole jsou
+    indexovaná kódem skupiny (předem lze alokovat size skupin). Dávky se
+    slučují vzorcem pro paralelní výpočet rozptylu (Chan et al.), výsledek
+    nezávisí na dělení dat do dávek. Kvantily jsou přesné jen pro kladné
+    hodnoty (hodnoty do 1 padnou do první přihrádky). """
+
+    def __init__(self, gamma: float = SKETCH_GAMMA,
+                 buckets: int = SKETCH_BUCKETS, size: int = 0):
+        self.gamma = gamma
+        self.buckets = buckets
+        self.count = np.zeros(size, dtype=np.int64)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.sketch = np.zeros((size, buckets), dtype=np.int64)
+
+    def _grow(self, size: int) -> None:
+        """ Rozšíření polí na size skupin. """
+
+        if size <= len(self.count):
+            return
+        extra = size - len(self.count)
+        self.count = np.append(self.count, np.zeros(extra, dtype=np.int64))
+        self.mean = np.append(self.mean, np.zeros(extra))
+        self.m2 = np.append(self.m2, np.zeros(extra))
+        self.sketch = np.vstack([self.sketch,
+                                 np.zeros((extra, self.buckets), dtype=np.int64)])
+
+    def update(self, codes: np.ndarray, values: np.ndarray) -> "GroupStats":
+        """ Přidání dávky hodnot values skupin codes,
+        záporné kódy (neznámá skupina) se vynechají. """
+
+        codes = np.asarray(codes, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        valid = codes >= 0
+        codes, values = codes[valid], values[valid]
+        if not len(codes):
+            return self
+
+        size = int(codes.max()) + 1
+        self._grow(size)
+
+        # Statistiky dávky po skupinách (seskupení podle kódu přes bincount)
+        count = np.bincount(codes, minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(codes, weights=values, minlength=size) / count
+        mean = np.nan_to_num(mean)
+        m2 = np.bincount(codes, weights=(values - mean[codes]) ** 2,
+                         minlength=size)
+
+        # Sloučení s dosavadními statistikami
+        total = self.count[:size] + count
+        delta = mean - self.mean[:size]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = np.where(total > 0, count / total, 0)
+        self.m2[:size] += m2 + delta ** 2 * self.count[:size] * ratio
+        self.mean[:size] += delta * ratio
+        self.count[:size] = total
+
+        # Přihrádky histogramu: ceil(log_gamma(hodnota)), nulové a záporné
+        # hodnoty (např. neznámá škoda -1) padnou do první přihrádky
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bucket = np.ceil(np.log(values) / np.log(self.gamma))
+        bucket = np.clip(np.nan_to_num(bucket, neginf=0), 0, self.buckets - 1)
+        self.sketch[:size] += np.bincount(
+            codes * self.buckets + bucket.astype(np.int64),
+            minlength=size * self.buckets).reshape(size, self.buckets)
+        return self
+
+    @property
+    def variance(self) -> np.ndarray:
+        """ Výběrový rozptyl (NaN pro skupiny s méně než 2 hodnotami). """
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    def quantile(self, q: float) -> np.ndarray:
+        """ Přibližný q-kvantil hodnot každé skupiny (NaN pro prázdné). """
+
+        cumulative = np.cumsum(self.sketch, axis=1)
+        rank = q * (self.count - 1)
+        index = np.argmax(cumulative > rank[:, np.newaxis], axis=1)
+
+        # Reprezentant přihrádky (gamma^(i-1), gamma^i>
+        estimate = 2 * self.gamma ** index / (self.gamma + 1)
+        return np.where(self.count > 0, estimate, np.nan)
+
+    def frame(self, labels: Dict[int, str],
+              quantiles: Sequence[float] = (0.5, 0.9)) -> pd.DataFrame:
+        """ Statistiky neprázdných skupin s kódem v labels (kód, popisek, count,
+        mean, std, q50, q90, ...) seřazené podle popisku. """
+
+        codes = np.flatnonzero(self.count)
+        codes = codes[np.isin(codes, list(labels))]
+        df = pd.DataFrame({
+            "code": codes,
+            "label": [labels[code] for code in codes],
+            "count": self.count[codes],
+            "mean": self.mean[codes],
+            "std": np.sqrt(self.variance[codes]),
+            **{f"q{round(q * 100)}": self.quantile(q)[codes] for q in quantiles},
+        })
+        return df.sort_values("label", kind="stable").reset_index(drop=True)
@@ -0,0 +1,91 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+# Vykreslení velkého počtu bodů jako rastru hustoty (jeden obrázek místo
+# značky pro každý bod), čas vykreslení nezávisí na počtu bodů.
+from typing import Tuple
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib import colors
+from matplotlib.image import AxesImage
+
+# Výchozí počet pixelů rastru na delší straně rozsahu
+DENSITY_RESOLUTION = 400
+
+Bounds = Tuple[float, float, float, float]
+
+
+def bounds_of(x: np.ndarray, y: np.ndarray) -> Bounds:
+    """ Rozsah (xmin, ymin, xmax, ymax) bodů. """
+    return (float(np.min(x)), float(np.min(y)),
+            float(np.max(x)), float(np.max(y)))
+
+
+def _pixel_grid(bounds: Bounds, resolution: int) -> Tuple[float, Tuple[int, int]]:
+    """ Velikost čtvercového pixelu a tvar rastru (řádky, sloupce) pro rozsah. """
+
+    xmin, ymin, xmax, ymax = bounds
+    pixel = max(xmax - xmin, ymax - ymin) / resolution or 1.0
+    shape = (max(int(np.ceil((ymax - ymin) / pixel)), 1),
+             max(int(np.ceil((xmax - xmin) / pixel)), 1))
+    return pixel, shape
+
+
+def rasterize(x: np.ndarray, y: np.ndarray, bounds: Bounds,
+              resolution: int = DENSITY_RESOLUTION,
+              values: np.ndarray = None) -> np.ndarray:
+    """ Rastr (řádky od ymin) s počtem bodů v každém pixelu, s values průměr
+    hodnot bodů v pixelu. Pixely jsou čtvercové, delší strana rozsahu má
+    resolution pixelů, body mimo rozsah se vynechají. Prázdné pixely jsou 0
+    (počty), resp. NaN (průměry). """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    xmin, ymin, xmax, ymax = bounds
+    pixel, shape = _pixel_grid(bounds, resolution)
+
+    # Index pixelu každého bodu (body na horní/pravé hraně patří do posledního)
+    col = np.minimum((x - xmin) // pixel, shape[1] - 1)
+    row = np.minimum((y - ymin) // pixel, shape[0] - 1)
+    inside = (col >= 0) & (row >= 0) & (x <= xmax) & (y <= ymax)
+    cells = row[inside].astype(np.int64) * shape[1] + col[inside].astype(np.int64)
+
+    counts = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+    if values is None:
+        return counts
+
+    sums = np.bincount(cells, weights=np.asarray(values, dtype=np.float64)[inside],
+                       minlength=shape[0] * shape[1]).reshape(shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def add_density(ax: plt.Axes, x: np.ndarray, y: np.ndarray, bounds: Bounds,
+                resolution: int = DENSITY_RESOLUTION, cmap: str = "viridis",
+                scale: str = "log", values: np.ndarray = None,
+                **kwargs) -> AxesImage:
+    """ Vykreslení rastru hustoty bodů (viz rasterize) do ax.
+    scale je "log" nebo "linear" měřítko barev, prázdné pixely jsou
+    průhledné. Ostatní argumenty se předají ax.imshow. """
+
+    raster = rasterize(x, y, bounds, resolution, values)
+    raster = np.ma.masked_invalid(raster) if values is not None else \
+        np.ma.masked_equal(raster, 0)
+
+    if scale == "log":
+        norm = colors.LogNorm()
+    elif scale == "linear":
+        norm = colors.Normalize()
+    else:
+        raise ValueError(f"Neznámé měřítko barev: {scale}")
+
+    # Rastr nad podkladovou mapou (TileCache.add_basemap, zorder 0)
+    kwargs.setdefault("zorder", 1)
+
+    # Rozsah obrázku podle celých pixelů rastru
+    xmin, ymin = bounds[:2]
+    pixel, _ = _pixel_grid(bounds, resolution)
+    extent = (xmin, xmin + raster.shape[1] * pixel,
+              ymin, ymin + raster.shape[0] * pixel)
+    return ax.imshow(raster, extent=extent, origin="lower", cmap=cmap,
+                     norm=norm, interpolation="nearest", **kwargs)
@@ -1,114 +1,54 @@
 #!/usr/bin/python3.8
 # coding=utf-8
 # %%
+import os
+import sys
+from typing import Dict, Iterable, Union
+
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
+
+from brand_stats import GroupStats
+
+# Sdílené tabulky popisků (labels.py v kořeni projektu)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from labels import CAR_BRANDS  # noqa: E402
+
+# Dávka dat: DataFrame nebo slovník polí (např. DataDownloader.iter_batches)
+Batch = Union[pd.DataFrame, Dict[str, np.ndarray]]
 # %%
-# Automobilové výrobní značky (p45a)
-CAR_BRANDS = {
-    1: "ALFA-ROMEO",
-    2: "AUDI",
-    3: "AVIA",
-    4: "BMW",
-    5: "CHEVROLET",
-    6: "CHRYSLER",
-    7: "CITROEN",
-    8: "DACIA",
-    9: "DAEWOO",
-    10: "DAF",
-    11: "DODGE",
-    12: "FIAT ",
-    13: "FORD",
-    14: "GAZ, VOLHA",
-    15: "FERRARI",
-    16: "HONDA",
-    17: "HYUNDAI",
-    18: "IFA",
-    19: "IVECO",
-    20: "JAGUAR",
-    21: "JEEP",
-    22: "LANCIA",
-    23: "LAND ROVER",
-    24: "LIAZ",
-    25: "MAZDA",
-    26: "MERCEDES",
-    27: "MITSUBISHI",
-    28: "MOSKVIČ",
-    29: "NISSAN",
-    30: "OLTCIT",
-    31: "OPEL",
-    32: "PEUGEOT",
-    33: "PORSCHE",
-    34: "PRAGA",
-    35: "RENAULT",
-    36: "ROVER",
-    37: "SAAB",
-    38: "SEAT",
-    39: "ŠKODA",
-    40: "SCANIA",
-    41: "SUBARU",
-    42: "SUZUKI",
-    43: "TATRA",
-    44: "TOYOTA",
-    45: "TRABANT",
-    46: "VAZ",
-    47: "VOLKSWAGEN",
-    48: "VOLVO",
-    49: "WARTBURG",
-    50: "ZASTAVA",
-    51: "AGM",
-    52: "ARO",
-    53: "AUSTIN",
-    54: "BARKAS",
-    55: "DAIHATSU",
-    56: "DATSUN",
-    57: "DESTACAR",
-    58: "ISUZU",
-    59: "KAROSA",
-    60: "KIA",
-    61: "LUBLIN",
-    62: "MAN",
-    63: "MASERATI",
-    64: "MULTICAR",
-    65: "PONTIAC",
-    66: "ROSS",
-    67: "SIMCA",
-    68: "SSANGYONG",
-    69: "TALBOT",
-    70: "TAZ",
-    71: "ZAZ",
-}
-
-
-def plot_doc(df: pd.DataFrame, fig_location: str = None,
-             show_figure: bool = False) -> pd.DataFrame:
-    """ Škoda na vozidle (p53) dle výrobní značky (p45a)
-        pro osobní automobily (p44 == 3). """
 
-    # Kopie dataframe s daty pro osobní automobily (p44 == 3)
-    df1 = df[["p45a", "p53"]][df["p44"] == 3].copy()
 
-    # Odstranit nulové hodnoty p53
-    df1 = df1[df1["p53"] > 0]
+def brand_stats(batches: Iterable[Batch]) -> GroupStats:
+    """ Statistiky škody (p53, v Kč) podle kódu výrobní značky (p45a)
+        pro osobní automobily (p44 == 3) v jednom průchodu dávkami dat. """
 
-    # Odstranit neplatné značky
-    df1 = df1[df1["p45a"].isin(CAR_BRANDS.keys())]
+    stats = GroupStats()
+    for batch in batches:
+        p44, p45a, p53 = (np.asarray(batch[col]) for col in ("p44", "p45a", "p53"))
 
-    # Převod na názvy výrobních značek
-    df1["p45a"] = df1["p45a"].map(CAR_BRANDS)
+        # Osobní automobily (p44 == 3) s nenulovou škodou p53
+        mask = (p44 == 3) & (p53 > 0)
 
-    # Uložení počtu vozidel na výrobní značku
-    p45a_count = df1["p45a"].value_counts()
+        # Sloupec p53 je ve stokorunách.
+        stats.update(p45a[mask], p53[mask] * 100)
+    return stats
 
-    # Sloupec p53 je ve stokorunách.
-    df1["p53"] *= 100
 
-    # Agregace dle výrobní značky (p45a) a výpočet průměrné škody (p53)
-    df1 = df1.groupby("p45a").agg({"p53": "mean"}).reset_index()
+def plot_doc(df: Union[pd.DataFrame, Iterable[Batch]], fig_location: str = None,
+             show_figure: bool = False) -> pd.DataFrame:
+    """ Škoda na vozidle (p53) dle výrobní značky (p45a)
+        pro osobní automobily (p44 == 3).
+        Data mohou být i posloupnost dávek (DataFrame nebo slovník polí). """
 
-    # Mapování počtu nehod na značku
-    df1["count"] = df1["p45a"].map(p45a_count)
+    # Statistiky seskupené podle kódu značky, názvy až pro výsledné skupiny
+    # (neplatné značky, tj. kódy mimo CAR_BRANDS, se vynechají)
+    stats = brand_stats([df] if isinstance(df, pd.DataFrame) else df)
+    df1 = stats.frame(CAR_BRANDS).drop(columns="code")
+    df1 = df1.rename(columns={"label": "p45a", "mean": "p53"})
+    df1 = df1[["p45a", "p53", "count", "std", "q50", "q90"]]
 
     # Seřazení podle průměrné škody (p53)
     df1 = df1.sort_values("p53", ascending=False)
@@ -148,17 +88,13 @@ def plot_doc(df: pd.DataFrame, fig_location: str = None,
 def print_result(df: pd.DataFrame) -> None:
     """ Výpis výsledků. """
 
-    # Výpis průměrné škody na výrobní značku
-    print("Průměrná škoda na výrobní značku:")
-    for _, row in df.iterrows():
-        print(f"{row['p45a']}: {row['p53']:.2f} Kč")
-
-    print("\n")
+    # Řádky výpisu pro všechny značky najednou
+    damage = df["p45a"] + ": " + df["p53"].map("{:.2f}".format) + " Kč"
+    count = df["p45a"] + ": " + df["count"].astype(str)
 
-    # Výpis počtu nehod na výrobní značku
-    print("\nPočet nehod na výrobní značku:")
-    for _, row in df.iterrows():
-        print(f"{row['p45a']}: {row['count']}")
+    # Výpis průměrné škody a počtu nehod na výrobní značku
+    print("Průměrná škoda na výrobní značku:",
+          *damage, "\n", "\nPočet nehod na výrobní značku:", *count, sep="\n")
 
 # %%
 if __name__ == "__main__":
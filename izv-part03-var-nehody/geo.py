@@ -1,27 +1,106 @@
 #!/usr/bin/python3.8
 # coding=utf-8
 # %%
+import os
+from functools import lru_cache
+from typing import Tuple
+
 import contextily as ctx
 import geopandas as gpd
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from pyproj import Transformer
 from sklearn.cluster import AgglomerativeClustering
 
+from density import DENSITY_RESOLUTION, add_density, bounds_of
+from tiles import TileCache
+
 # Vybraný kraj (Vysočina)
 REGION = "VYS"
 
+# Sloupce uložené v cache s promítnutými souřadnicemi (viz load_geo)
+GEO_COLUMNS = ["p1", "region", "p36", "year",
+               "x_5514", "y_5514", "x_3857", "y_3857"]
+
+# Počet shluků v plot_cluster
+N_CLUSTERS = 69
+
+# Do tohoto počtu bodů se shlukuje přesně (paměť complete-linkage je O(n²))
+EXACT_CLUSTER_LIMIT = 5000
+
+# Nejvyšší počet obsazených buněk mřížky shlukovaných v režimu "grid"
+MAX_CLUSTER_CELLS = 4000
+
+# Adresář s dlaždicemi podkladové mapy
+TILE_FOLDER = "data/tiles"
+
 # %%
 
 
-def make_geo(df: pd.DataFrame) -> gpd.GeoDataFrame:
-    """ Konvertovani dataframe do GeoDataFrame se spravnym kodovanim. """
+@lru_cache(maxsize=None)
+def default_tiles() -> TileCache:
+    """ Sdílená cache dlaždic podkladové mapy pro plot_geo a plot_cluster. """
+    return TileCache(ctx.providers.Stamen.TonerLite, TILE_FOLDER)
+
+
+def project(df: pd.DataFrame) -> pd.DataFrame:
+    """ Doplnění souřadnic v S-JTSK (EPSG:5514) a Web Mercator (EPSG:3857)
+    jako obyčejných sloupců x_*, y_* a roku nehody (sloupec year). """
 
     # Smazání řádků, které neobsahují souřadnice
     df = df.dropna(subset=["d", "e"]).copy()
 
+    df["x_5514"] = df["d"].to_numpy(dtype=np.float64)
+    df["y_5514"] = df["e"].to_numpy(dtype=np.float64)
+
+    # Převod všech bodů do EPSG:3857 jednou transformací nad poli
+    transformer = Transformer.from_crs("epsg:5514", "epsg:3857",
+                                       always_xy=True)
+    df["x_3857"], df["y_3857"] = transformer.transform(df["x_5514"].to_numpy(),
+                                                       df["y_5514"].to_numpy())
+
+    df["year"] = pd.to_datetime(df["p2a"], format="%Y-%m-%d").dt.year \
+        .astype(np.int16)
+    return df
+
+
+def _geo_filename(filename: str) -> str:
+    """ Cesta k cache s promítnutými souřadnicemi pro soubor nehod. """
+    return filename.replace(".pkl.gz", "") + ".geo.pkl"
+
+
+def load_geo(filename: str, use_cache: bool = True) -> pd.DataFrame:
+    """ Načtení nehod s promítnutými souřadnicemi (sloupce GEO_COLUMNS).
+    Výsledek se ukládá vedle souboru nehod a znovu se použije,
+    dokud je novější než soubor nehod. """
+
+    geo_filename = _geo_filename(filename)
+    if (use_cache and os.path.exists(geo_filename) and
+            os.path.getmtime(geo_filename) >= os.path.getmtime(filename)):
+        return pd.read_pickle(geo_filename)
+
+    df = project(pd.read_pickle(filename))[GEO_COLUMNS]
+    df = df.reset_index(drop=True)
+
+    if use_cache:
+        tmp_filename = geo_filename + ".tmp"
+        df.to_pickle(tmp_filename, compression=None, protocol=5)
+        os.replace(tmp_filename, geo_filename)
+    return df
+
+
+def make_geo(df: pd.DataFrame) -> gpd.GeoDataFrame:
+    """ Konvertovani dataframe do GeoDataFrame se spravnym kodovanim. """
+
+    # Řádky se souřadnicemi, promítnuté souřadnice jako sloupce
+    if "x_5514" not in df:
+        df = project(df)
+
     # Konverze na geopandas.GeoDataFrame s CRS pro S-JTSK (EPSG:5514)
     return gpd.GeoDataFrame(df,
-                            geometry=gpd.points_from_xy(x=df["d"], y=df["e"]),
+                            geometry=gpd.points_from_xy(x=df["x_5514"],
+                                                        y=df["y_5514"]),
                             crs="epsg:5514")
 
 # %%
@@ -33,23 +112,30 @@ def _rt_name(road_type: int) -> str:
     return "dálnice" if road_type == 0 else "silnice 1. třídy"
 
 
-def plot_geo(gdf: gpd.GeoDataFrame, fig_location: str = None,
-             show_figure: bool = False):
+def plot_geo(gdf: pd.DataFrame, fig_location: str = None,
+             show_figure: bool = False, tiles: TileCache = None,
+             mode: str = "points", resolution: int = DENSITY_RESOLUTION,
+             cmap: str = "Reds", scale: str = "log"):
     """ Vykresleni grafu s sesti podgrafy podle lokality nehody
-     (dalnice vs prvni trida) pro roky 2018-2020 """
+     (dalnice vs prvni trida) pro roky 2018-2020
+     (gdf z make_geo nebo load_geo, tj. s promítnutými souřadnicemi,
+     tiles je cache dlaždic podkladové mapy, výchozí default_tiles()).
+     V režimu mode="density" se místo bodů kreslí rastr počtu nehod
+     s resolution pixely na delší straně, barvami cmap a měřítkem scale
+     ("log" nebo "linear"). """
 
-    # Výběr regionu do nového dataframe
-    gdf = gdf[["geometry", "p2a", "p36"]][gdf["region"] == REGION].copy()
+    tiles = default_tiles() if tiles is None else tiles
 
-    # Získání data a filtrování roků 2018-2020
-    gdf["year"] = pd.to_datetime(gdf["p2a"], format="%Y-%m-%d").dt.year
-    gdf = gdf[gdf["year"].isin([2018, 2019, 2020])]
+    # Výběr regionu a roků 2018-2020 do nového dataframe
+    gdf = gdf[["x_3857", "y_3857", "year", "p36"]][
+        (gdf["region"] == REGION) & gdf["year"].isin([2018, 2019, 2020])]
 
     # Filtrování typů silnic (0 => dálnice, 1 => silnice 1. třídy)
     gdf = gdf[gdf["p36"].isin([0, 1])]
 
-    # Převod souřadnic na GPS pro zobrazení
-    gdf = gdf.to_crs("epsg:3857")
+    # Souřadnice pro zobrazení jsou již v EPSG:3857
+    bounds = (gdf["x_3857"].min(), gdf["y_3857"].min(),
+              gdf["x_3857"].max(), gdf["y_3857"].max())
 
     # Vytvoření mapy
     fig, axes = plt.subplots(3, 2, figsize=(15, 18))
@@ -66,17 +152,19 @@ def plot_geo(gdf: gpd.GeoDataFrame, fig_location: str = None,
             ax.get_xaxis().set_visible(False)
             ax.get_yaxis().set_visible(False)
 
-            ax.set_xlim(gdf["geometry"].total_bounds[0],
-                        gdf["geometry"].total_bounds[2])
-            ax.set_ylim(gdf["geometry"].total_bounds[1],
-                        gdf["geometry"].total_bounds[3])
+            ax.set_xlim(bounds[0], bounds[2])
+            ax.set_ylim(bounds[1], bounds[3])
 
-            # Zobrazení bodů
-            subgroup.plot(ax=ax, color="red", markersize=1)
+            # Zobrazení bodů nebo rastru hustoty nehod
+            if mode == "density":
+                add_density(ax, subgroup["x_3857"], subgroup["y_3857"],
+                            bounds, resolution, cmap, scale)
+            else:
+                ax.scatter(subgroup["x_3857"], subgroup["y_3857"],
+                           color="red", s=1)
 
-            # Zobrazení podkladové mapy
-            ctx.add_basemap(ax, crs=subgroup.crs.to_string(),
-                            source=ctx.providers.Stamen.TonerLite)
+            # Zobrazení podkladové mapy (pro všechny podgrafy stejná)
+            tiles.add_basemap(ax, bounds)
 
     # Zobrazení a uložení grafu
     fig.tight_layout()
@@ -88,43 +176,115 @@ def plot_geo(gdf: gpd.GeoDataFrame, fig_location: str = None,
 # %%
 
 
-def plot_cluster(gdf: gpd.GeoDataFrame, fig_location: str = None,
-                 show_figure: bool = False):
+def _grid_cells(points: np.ndarray, cell_size: float,
+                max_cells: int) -> Tuple[np.ndarray, np.ndarray, float]:
+    """ Rozdělení bodů do čtvercové mřížky, velikost buňky se zdvojnásobuje,
+    dokud je obsazených buněk více než max_cells.
+    Vrací (index buňky každého bodu, těžiště buněk, velikost buňky). """
+
+    origin = points.min(axis=0)
+    while True:
+        cells = ((points - origin) // cell_size).astype(np.int64)
+        keys = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+        unique, inverse = np.unique(keys, return_inverse=True)
+        if len(unique) <= max_cells:
+            break
+        cell_size *= 2
+
+    # Těžiště bodů v každé obsazené buňce
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse)
+    centroids = np.column_stack([
+        np.bincount(inverse, weights=points[:, 0]) / counts,
+        np.bincount(inverse, weights=points[:, 1]) / counts])
+    return inverse, centroids, cell_size
+
+
+def cluster_points(x: np.ndarray, y: np.ndarray,
+                   n_clusters: int = N_CLUSTERS, method: str = "exact",
+                   cell_size: float = 100.0,
+                   max_cells: int = MAX_CLUSTER_CELLS) -> np.ndarray:
+    """ Shlukování bodů (souřadnice v metrech) metodou Complete-linkage.
+    Metoda "exact" shlukuje všechny body (paměť i čas O(n²)), metoda "grid"
+    rozdělí body do mřížky s nejvýše max_cells obsazenými buňkami a shlukuje
+    jen těžiště buněk (paměť O(n + max_cells²)), body dostanou shluk své
+    buňky (přibližné shlukování). Metoda "auto" použije "exact" do
+    EXACT_CLUSTER_LIMIT bodů, jinak "grid".
+    Vrací číslo shluku pro každý bod. """
+
+    points = np.column_stack([np.asarray(x, dtype=np.float64),
+                              np.asarray(y, dtype=np.float64)])
+    if method == "auto":
+        method = "exact" if len(points) <= EXACT_CLUSTER_LIMIT else "grid"
+
+    if method == "exact":
+        model = AgglomerativeClustering(n_clusters=n_clusters,
+                                        linkage="complete")
+        return model.fit(points).labels_
+    if method != "grid":
+        raise ValueError(f"Neznámá metoda shlukování: {method}")
+
+    inverse, centroids, _ = _grid_cells(points, cell_size, max_cells)
+
+    # Méně buněk než shluků => každá buňka je samostatný shluk
+    if len(centroids) <= n_clusters:
+        return inverse
+
+    model = AgglomerativeClustering(n_clusters=n_clusters, linkage="complete")
+    return model.fit(centroids).labels_[inverse]
+
+
+def plot_cluster(gdf: pd.DataFrame, fig_location: str = None,
+                 show_figure: bool = False, method: str = "exact",
+                 tiles: TileCache = None, mode: str = "points",
+                 resolution: int = DENSITY_RESOLUTION, cmap: str = "viridis",
+                 scale: str = "linear"):
     """ Vykresleni grafu s lokalitou vsech nehod v kraji
-    shlukovanych do clusteru. """
+    shlukovanych do clusteru
+    (gdf z make_geo nebo load_geo, tj. s promítnutými souřadnicemi,
+    method viz cluster_points, tiles, mode, resolution, cmap a scale
+    viz plot_geo, rastr v režimu "density" má v pixelu průměrnou
+    velikost shluku) """
+
+    tiles = default_tiles() if tiles is None else tiles
 
     # Výběr regionu a silnic 1. třídy do nového dataframe
-    gdf = gdf[["region", "p36", "d", "e", "geometry"]].copy()
-    gdf = gdf[gdf["region"] == REGION]
-    gdf = gdf[gdf["p36"] == 1]
+    gdf = gdf[["x_5514", "y_5514", "x_3857", "y_3857"]][
+        (gdf["region"] == REGION) & (gdf["p36"] == 1)].copy()
 
     # Zvolen Agglomerative clustering ve variantě Complete-linkage.
     # Lepší výsledky než jiné zvažované metody (K-means, Ward, Single-linkage).
-    model = AgglomerativeClustering(n_clusters=69, linkage="complete")
-    model.fit(gdf[["d", "e"]])
-
-    # Získání clusterů
-    gdf["cluster"] = model.labels_
+    # S method="grid" (nebo "auto" nad EXACT_CLUSTER_LIMIT bodů) se pro velký
+    # počet bodů přibližně shlukují těžiště buněk mřížky.
+    gdf["cluster"] = cluster_points(gdf["x_5514"], gdf["y_5514"],
+                                    method=method)
 
     # Každému bodu přiřadit počet bodů v clusteru
     gdf["cluster_cnt"] = gdf["cluster"].map(gdf["cluster"].value_counts())
 
-    # Převod souřadnic na GPS pro zobrazení
-    gdf = gdf.to_crs("epsg:3857")
-
     # Vytvoření mapy
     fig, ax = plt.subplots(figsize=(15, 10))
     fig.set_facecolor("#fefefe")
     ax.set_title(f"Nehody v {REGION} kraji na silnicích 1. třídy")
+    ax.set_aspect("equal")
     ax.get_xaxis().set_visible(False)
     ax.get_yaxis().set_visible(False)
 
-    # Zobrazení bodů
-    gdf.plot(ax=ax, markersize=2, column="cluster_cnt", legend=True)
+    # Zobrazení bodů nebo rastru (souřadnice v EPSG:3857)
+    if mode == "density":
+        bounds = bounds_of(gdf["x_3857"], gdf["y_3857"])
+        points = add_density(ax, gdf["x_3857"], gdf["y_3857"], bounds,
+                             resolution, cmap, scale,
+                             values=gdf["cluster_cnt"])
+        ax.set_xlim(bounds[0], bounds[2])
+        ax.set_ylim(bounds[1], bounds[3])
+    else:
+        points = ax.scatter(gdf["x_3857"], gdf["y_3857"], s=2,
+                            c=gdf["cluster_cnt"], cmap=cmap)
+    fig.colorbar(points, ax=ax)
 
     # Zobrazení podkladové mapy
-    ctx.add_basemap(ax=ax, crs=gdf.crs.to_string(),
-                    source=ctx.providers.Stamen.TonerLite)
+    tiles.add_basemap(ax)
 
     # Zobrazení a uložení grafu
     fig.tight_layout()
@@ -137,9 +297,8 @@ def plot_cluster(gdf: gpd.GeoDataFrame, fig_location: str = None,
 if __name__ == "__main__":
     # zde muzete delat libovolne modifikace
     # %%
-    df = pd.read_pickle("accidents.pkl.gz")
-    # %%
-    gdf = make_geo(df)
+    # Nehody s promítnutými souřadnicemi (cache accidents.geo.pkl)
+    gdf = load_geo("accidents.pkl.gz")
     # %%
     plot_geo(gdf, "geo1.png", True)
     # %%
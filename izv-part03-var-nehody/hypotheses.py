@@ -0,0 +1,202 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+# Testy hypotéz ze stat.ipynb pro všechny kombinace najednou:
+# χ² test úmrtí podle druhu silnice (p36) v každém kraji a Welchův t-test
+# škody (p53) pro každou dvojici výrobních značek (p45a) v každém kraji.
+# Kontingenční tabulky i momenty skupin se počítají jedním průchodem daty,
+# statistiky testů pro všechny kombinace vektorově v numpy.
+from multiprocessing import Pool
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from brand_stats import GroupStats
+
+
+def _group_codes(df: pd.DataFrame, by: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Kódy skupin 0..G-1 pro řádky df podle sloupce by a názvy skupin,
+    bez by je jediná skupina "všechny" (kód 0). """
+
+    if by is None:
+        return np.zeros(len(df), dtype=np.int64), np.array(["všechny"], dtype=object)
+    codes, names = pd.factorize(df[by], sort=True)
+    return codes.astype(np.int64), np.asarray(names, dtype=object)
+
+
+def death_tables(df: pd.DataFrame, by: Optional[str] = "region") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Kontingenční tabulky úmrtí (p13a > 0) × druh silnice p36 == v pro každou
+    skupinu a každou hodnotu v (stejné jako pd.crosstab v stat.ipynb).
+    Vrací (názvy skupin, hodnoty p36, tabulky tvaru (G, V, 2, 2)), kde
+    tabulka[g, v] má řádky death False/True a sloupce p36 != v / p36 == v. """
+
+    groups, names = _group_codes(df, by)
+    p36_codes, p36_values = pd.factorize(df["p36"], sort=True)
+    death = (df["p13a"].to_numpy() > 0).astype(np.int64)
+
+    # Počty nehod skupina × p36 × úmrtí jedním průchodem (bincount)
+    shape = (len(names), len(p36_values), 2)
+    counts = np.bincount((groups * shape[1] + p36_codes) * 2 + death,
+                         minlength=np.prod(shape)).reshape(shape)
+
+    # Sloupec p36 == v jsou počty hodnoty v, sloupec p36 != v zbytek skupiny
+    inside = counts
+    outside = counts.sum(axis=1, keepdims=True) - counts
+    tables = np.stack([outside, inside], axis=-1)
+    return names, np.asarray(p36_values), tables
+
+
+def chi2_test(tables: np.ndarray, correction: bool = True) -> Dict[str, np.ndarray]:
+    """ χ² test nezávislosti pro všechny tabulky (..., R, C) najednou,
+    shodný se scipy.stats.chi2_contingency (včetně Yatesovy korekce
+    pro tabulky 2 × 2). Vrací chi2, p, dof a expected, pro tabulky
+    s prázdným řádkem nebo sloupcem je chi2 i p NaN. """
+
+    observed = np.asarray(tables, dtype=np.float64)
+    total = observed.sum(axis=(-2, -1), keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        expected = (observed.sum(axis=-1, keepdims=True) *
+                    observed.sum(axis=-2, keepdims=True) / total)
+
+    dof = (observed.shape[-2] - 1) * (observed.shape[-1] - 1)
+    diff = observed - expected
+    if correction and dof == 1:
+        diff = np.sign(diff) * np.maximum(np.abs(diff) - 0.5, 0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        chi2 = (diff ** 2 / expected).sum(axis=(-2, -1))
+    return {"chi2": chi2, "p": stats.chi2.sf(chi2, dof), "dof": dof,
+            "expected": expected}
+
+
+def death_tests(df: pd.DataFrame, by: Optional[str] = "region") -> pd.DataFrame:
+    """ Hypotéza 1 ze stat.ipynb pro všechny skupiny a druhy silnic:
+    χ² test a pravděpodobnost úmrtí na daném druhu silnice (observed
+    i expected) a mimo něj. """
+
+    names, p36_values, tables = death_tables(df, by)
+    result = chi2_test(tables)
+    observed, expected = tables.astype(np.float64), result["expected"]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            "group": np.repeat(names, len(p36_values)),
+            "p36": np.tile(p36_values, len(names)),
+            "accidents": observed[..., 1].sum(axis=-1).ravel(),
+            "death_rate": (observed[..., 1, 1] / observed[..., 1].sum(axis=-1)).ravel(),
+            "death_rate_other": (observed[..., 1, 0] / observed[..., 0].sum(axis=-1)).ravel(),
+            "expected_rate": (expected[..., 1, 1] / expected[..., 1].sum(axis=-1)).ravel(),
+            "chi2": result["chi2"].ravel(),
+            "p": result["p"].ravel(),
+        })
+
+
+def welch_test(count_a: np.ndarray, mean_a: np.ndarray, var_a: np.ndarray,
+               count_b: np.ndarray, mean_b: np.ndarray,
+               var_b: np.ndarray) -> Dict[str, np.ndarray]:
+    """ Welchův t-test (scipy.stats.ttest_ind s equal_var=False)
+    z momentů skupin, vektorově pro libovolný počet dvojic. """
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        se_a, se_b = var_a / count_a, var_b / count_b
+        t = (mean_a - mean_b) / np.sqrt(se_a + se_b)
+        dof = (se_a + se_b) ** 2 / (se_a ** 2 / (count_a - 1) +
+                                     se_b ** 2 / (count_b - 1))
+    return {"t": t, "dof": dof, "p": 2 * stats.t.sf(np.abs(t), dof)}
+
+
+def _damage_stats(df: pd.DataFrame, by: Optional[str]) -> Tuple[np.ndarray, np.ndarray, GroupStats]:
+    """ Momenty škody p53 pro skupinu × značku jedním průchodem
+    (GroupStats nad kombinovaným kódem skupina * počet značek + značka). """
+
+    groups, names = _group_codes(df, by)
+    brands = df["p45a"].to_numpy().astype(np.int64)
+    size = int(brands.max(initial=0)) + 1
+    codes = np.where(brands >= 0, groups * size + brands, -1)
+    damage = GroupStats(size=len(names) * size).update(codes, df["p53"].to_numpy())
+    return names, np.arange(size), damage
+
+
+def brand_tests(df: pd.DataFrame, by: Optional[str] = "region", min_count: int = 2,
+                permutations: int = 0, workers: int = 1, seed: int = 0) -> pd.DataFrame:
+    """ Hypotéza 2 ze stat.ipynb pro všechny skupiny a dvojice značek
+    (brand_a < brand_b) s alespoň min_count nehodami v obou značkách:
+    Welchův t-test škody p53 (t > 0 => značka a má vyšší průměrnou škodu).
+    S permutations > 0 se navíc spočte p-hodnota permutačního testu
+    (p_perm, paralelně ve workers procesech). """
+
+    names, brands, damage = _damage_stats(df, by)
+    shape = (len(names), len(brands))
+    count = damage.count.reshape(shape)
+    mean, var = damage.mean.reshape(shape), damage.variance.reshape(shape)
+
+    # Všechny dvojice značek ve všech skupinách najednou
+    a, b = np.triu_indices(len(brands), k=1)
+    group = np.repeat(np.arange(len(names)), len(a))
+    a, b = np.tile(a, len(names)), np.tile(b, len(names))
+    valid = (count[group, a] >= min_count) & (count[group, b] >= min_count)
+    group, a, b = group[valid], a[valid], b[valid]
+
+    result = welch_test(count[group, a], mean[group, a], var[group, a],
+                        count[group, b], mean[group, b], var[group, b])
+    tests = pd.DataFrame({
+        "group": names[group], "brand_a": brands[a], "brand_b": brands[b],
+        "count_a": count[group, a], "count_b": count[group, b],
+        "mean_a": mean[group, a], "mean_b": mean[group, b],
+        "t": result["t"], "dof": result["dof"], "p": result["p"],
+    })
+
+    if permutations > 0:
+        tests["p_perm"] = permutation_tests(df, by, group, a, b, result["t"],
+                                            permutations, workers, seed)
+    return tests
+
+
+def _permutation_p(args: Tuple[np.ndarray, int, float, int, int]) -> float:
+    """ p-hodnota permutačního testu pro jednu dvojici: hodnoty values,
+    prvních count_a patří značce a, pozorovaná statistika t. """
+
+    values, count_a, t, permutations, seed = args
+    rng = np.random.default_rng(seed)
+    exceed = 0
+    # Permutace po dávkách, aby matice permutací zůstala malá
+    for start in range(0, permutations, 256):
+        size = min(256, permutations - start)
+        shuffled = rng.permuted(np.tile(values, (size, 1)), axis=1)
+        x, y = shuffled[:, :count_a], shuffled[:, count_a:]
+        perm_t = welch_test(count_a, x.mean(axis=1), x.var(axis=1, ddof=1),
+                            len(values) - count_a, y.mean(axis=1),
+                            y.var(axis=1, ddof=1))["t"]
+        exceed += np.count_nonzero(np.abs(perm_t) >= abs(t))
+    return (exceed + 1) / (permutations + 1)
+
+
+def permutation_tests(df: pd.DataFrame, by: Optional[str], group: np.ndarray,
+                      a: np.ndarray, b: np.ndarray, t: np.ndarray,
+                      permutations: int = 1000, workers: int = 1,
+                      seed: int = 0) -> np.ndarray:
+    """ Oboustranné permutační testy Welchovy statistiky t pro dvojice
+    značek (a[i], b[i]) ve skupině group[i], dvojice se počítají paralelně. """
+
+    groups, _ = _group_codes(df, by)
+    brands = df["p45a"].to_numpy().astype(np.int64)
+    damage = df["p53"].to_numpy().astype(np.float64)
+
+    # Hodnoty každé dvojice (skupina, značka) jako úseky jednoho seřazeného pole
+    size = int(brands.max(initial=0)) + 1
+    codes = np.where(brands >= 0, groups * size + brands, -1)
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(codes.max(initial=0) + 2))
+    values = damage[order]
+
+    def _values(code: int) -> np.ndarray:
+        return values[starts[code]:starts[code + 1]]
+
+    tasks = [(np.concatenate([_values(g * size + x), _values(g * size + y)]),
+              len(_values(g * size + x)), t_value, permutations, seed + i)
+             for i, (g, x, y, t_value) in enumerate(zip(group, a, b, t))]
+    if workers > 1:
+        with Pool(workers) as pool:
+            return np.array(pool.map(_permutation_p, tasks, chunksize=16))
+    return np.array([_permutation_p(task) for task in tasks])
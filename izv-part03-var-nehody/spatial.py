@@ -0,0 +1,189 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+# Prostorový index nad souřadnicemi nehod (rovnoměrná mřížka uložená jako
+# seřazená pole): dotazy na obdélník, okolí bodu, k nejbližších nehod
+# a počty nehod v buňkách mřížky (hotspoty).
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from geo import load_geo
+
+# Výchozí velikost buňky mřížky v metrech (S-JTSK)
+CELL_SIZE = 1000.0
+
+
+class SpatialIndex:
+    """ Body seřazené podle buňky mřížky, buňka (cx, cy) má číslo cx * ny + cy
+    a její body jsou na pozicích starts[cell]:starts[cell + 1].
+    Buňky jednoho sloupce mřížky (stejné cx) tedy leží v polích za sebou.
+    Dotazy vrací pozice bodů ve vstupních polích (např. řádků make_geo). """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, positions: np.ndarray,
+                 starts: np.ndarray, origin: np.ndarray, shape: np.ndarray,
+                 cell_size: float):
+        self.x = x
+        self.y = y
+        self.positions = positions
+        self.starts = starts
+        self.origin = origin
+        self.shape = shape
+        self.cell_size = cell_size
+
+    @classmethod
+    def from_arrays(cls, x: np.ndarray, y: np.ndarray,
+                    cell_size: float = CELL_SIZE) -> "SpatialIndex":
+        """ Sestavení indexu ze souřadnic, body bez souřadnic (NaN) se vynechají. """
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        positions = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        x, y = x[positions], y[positions]
+
+        origin = np.array([x.min(initial=0), y.min(initial=0)])
+        cx = ((x - origin[0]) // cell_size).astype(np.int64)
+        cy = ((y - origin[1]) // cell_size).astype(np.int64)
+        shape = np.array([cx.max(initial=0) + 1, cy.max(initial=0) + 1])
+
+        # Seřazení bodů podle čísla buňky a začátky buněk v seřazených polích
+        cells = cx * shape[1] + cy
+        order = np.argsort(cells, kind="stable")
+        counts = np.bincount(cells, minlength=shape[0] * shape[1])
+        starts = np.concatenate([[0], np.cumsum(counts)])
+
+        return cls(x[order], y[order], positions[order], starts, origin, shape,
+                   cell_size)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame,
+                   cell_size: float = CELL_SIZE) -> "SpatialIndex":
+        """ Index nad výstupem geo.make_geo / geo.load_geo (x_5514, y_5514)
+        nebo nad původními sloupci d, e. """
+
+        x, y = ("x_5514", "y_5514") if "x_5514" in df else ("d", "e")
+        return cls.from_arrays(df[x].to_numpy(), df[y].to_numpy(), cell_size)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, np.ndarray],
+                  cell_size: float = CELL_SIZE) -> "SpatialIndex":
+        """ Index nad daty z DataDownloader.get_dict (sloupce d, e). """
+
+        return cls.from_arrays(data["d"], data["e"], cell_size)
+
+    def save(self, path: str) -> None:
+        """ Uložení indexu do souboru .npz. """
+
+        np.savez(path, x=self.x, y=self.y, positions=self.positions,
+                 starts=self.starts, origin=self.origin, shape=self.shape,
+                 cell_size=self.cell_size)
+
+    @classmethod
+    def load(cls, path: str) -> "SpatialIndex":
+        """ Načtení indexu uloženého metodou save. """
+
+        with np.load(path) as data:
+            return cls(data["x"], data["y"], data["positions"],
+                       data["starts"], data["origin"], data["shape"],
+                       float(data["cell_size"]))
+
+    def _cell_range(self, low: float, high: float, axis: int) -> range:
+        """ Rozsah indexů buněk v ose axis pokrývající interval <low, high>. """
+
+        first = int(max((low - self.origin[axis]) // self.cell_size, 0))
+        last = int(min((high - self.origin[axis]) // self.cell_size,
+                       self.shape[axis] - 1))
+        return range(first, last + 1)
+
+    def _bbox_slots(self, xmin: float, ymin: float, xmax: float,
+                    ymax: float) -> np.ndarray:
+        """ Indexy do seřazených polí pro body v obdélníku. """
+
+        rows = self._cell_range(ymin, ymax, 1)
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+
+        # Pro každý sloupec mřížky je rozsah buněk jeden souvislý úsek polí
+        slots = [np.arange(self.starts[cx * self.shape[1] + rows.start],
+                           self.starts[cx * self.shape[1] + rows.stop])
+                 for cx in self._cell_range(xmin, xmax, 0)]
+        if not slots:
+            return np.empty(0, dtype=np.int64)
+        slots = np.concatenate(slots)
+
+        x, y = self.x[slots], self.y[slots]
+        return slots[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)]
+
+    def bbox(self, xmin: float, ymin: float, xmax: float,
+             ymax: float) -> np.ndarray:
+        """ Pozice bodů v obdélníku <xmin, xmax> × <ymin, ymax>. """
+
+        return self.positions[self._bbox_slots(xmin, ymin, xmax, ymax)]
+
+    def radius(self, x: float, y: float, r: float) -> np.ndarray:
+        """ Pozice bodů ve vzdálenosti nejvýše r od bodu (x, y). """
+
+        slots = self._bbox_slots(x - r, y - r, x + r, y + r)
+        distances = np.hypot(self.x[slots] - x, self.y[slots] - y)
+        return self.positions[slots[distances <= r]]
+
+    def nearest(self, x: float, y: float, k: int = 1) -> np.ndarray:
+        """ Pozice k nejbližších bodů k bodu (x, y) seřazené podle vzdálenosti. """
+
+        k = min(k, len(self.x))
+        r = self.cell_size
+        extent = self.cell_size * float(np.hypot(*self.shape))
+        while True:
+            # Všechny body do vzdálenosti r jsou ve čtverci se stranou 2r
+            slots = self._bbox_slots(x - r, y - r, x + r, y + r)
+            distances = np.hypot(self.x[slots] - x, self.y[slots] - y)
+            if np.count_nonzero(distances <= r) >= k or r > extent + np.hypot(
+                    x - self.origin[0], y - self.origin[1]):
+                break
+            r *= 2
+
+        order = np.argsort(distances, kind="stable")[:k]
+        return self.positions[slots[order]]
+
+    def hotspots(self, top: Optional[int] = None) -> pd.DataFrame:
+        """ Počty bodů v buňkách mřížky sestupně (jen neprázdné buňky,
+        top nejvíce obsazených), se středy buněk x, y. """
+
+        counts = np.diff(self.starts)
+        cells = np.flatnonzero(counts)
+        cells = cells[np.argsort(-counts[cells], kind="stable")][:top]
+
+        cx, cy = np.divmod(cells, self.shape[1])
+        return pd.DataFrame({
+            "x": self.origin[0] + (cx + 0.5) * self.cell_size,
+            "y": self.origin[1] + (cy + 0.5) * self.cell_size,
+            "count": counts[cells],
+        })
+
+
+def _index_filename(filename: str) -> str:
+    """ Cesta k uloženému indexu pro soubor nehod. """
+    return filename.replace(".pkl.gz", "") + ".index.npz"
+
+
+def load_index(filename: str, cell_size: float = CELL_SIZE,
+               use_cache: bool = True) -> SpatialIndex:
+    """ Prostorový index nad nehodami ze souboru filename, pozice ukazují
+    do řádků geo.load_geo(filename). Index se ukládá vedle souboru nehod
+    a znovu se použije, dokud je novější a má stejnou velikost buňky. """
+
+    index_filename = _index_filename(filename)
+    if (use_cache and os.path.exists(index_filename) and
+            os.path.getmtime(index_filename) >= os.path.getmtime(filename)):
+        index = SpatialIndex.load(index_filename)
+        if index.cell_size == cell_size:
+            return index
+
+    index = SpatialIndex.from_frame(load_geo(filename, use_cache), cell_size)
+    if use_cache:
+        # np.savez doplní příponu .npz, dočasný soubor ji tedy musí mít
+        tmp_filename = index_filename[:-len(".npz")] + ".tmp.npz"
+        index.save(tmp_filename)
+        os.replace(tmp_filename, index_filename)
+    return index
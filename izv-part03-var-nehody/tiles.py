@@ -0,0 +1,157 @@
+#!/usr/bin/python3.8
+# coding=utf-8
+# Podkladová mapa z dlaždic uložených na disku (místo ctx.add_basemap).
+# Každá dlaždice se stahuje nejvýše jednou do adresáře cache, obrázek mapy
+# se pro daný rozsah skládá jednou a znovu se použije ve všech podgrafech.
+import io
+import math
+import os
+from typing import Dict, Tuple, Union
+
+import matplotlib.pyplot as plt
+import numpy as np
+import requests
+from PIL import Image
+
+# Polovina šířky světa ve Web Mercator (EPSG:3857) v metrech
+WORLD_HALF = 20037508.342789244
+
+# Velikost dlaždice v pixelech
+TILE_SIZE = 256
+
+# Nejvyšší automaticky zvolený zoom
+MAX_ZOOM = 18
+
+Bounds = Tuple[float, float, float, float]
+
+
+class TileCache:
+    """ Dlaždice zdroje source (šablona URL s {z}, {x}, {y} nebo poskytovatel
+    contextily/xyzservices) uložené v adresáři folder/{z}/{x}/{y}.png.
+    V režimu offline se nic nestahuje, chybějící dlaždice zůstanou průhledné. """
+
+    def __init__(self, source, folder: str = "data/tiles",
+                 offline: bool = False):
+        self.url = source if isinstance(source, str) else source.build_url()
+        self.folder = folder
+        self.offline = offline
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "izv-nehody"
+        self.missing = 0
+        self._images: Dict[Tuple[int, int, int, int, int],
+                           Tuple[np.ndarray, Bounds]] = {}
+
+    @staticmethod
+    def zoom_for(bounds: Bounds) -> int:
+        """ Zoom, při kterém kratší strana rozsahu pokryje alespoň 2 dlaždice
+        (obdobně jako automatický zoom contextily). """
+
+        span = min(bounds[2] - bounds[0], bounds[3] - bounds[1])
+        if span <= 0:
+            return MAX_ZOOM
+        zoom = math.ceil(math.log2(4 * WORLD_HALF / span))
+        return max(0, min(zoom, MAX_ZOOM))
+
+    @staticmethod
+    def _tile_size(zoom: int) -> float:
+        """ Velikost strany dlaždice v metrech. """
+        return 2 * WORLD_HALF / 2 ** zoom
+
+    def _tile_range(self, bounds: Bounds, zoom: int) -> Tuple[int, int, int, int]:
+        """ Indexy dlaždic (x0, y0, x1, y1) pokrývajících rozsah (včetně). """
+
+        size = self._tile_size(zoom)
+        last = 2 ** zoom - 1
+        x0 = int((bounds[0] + WORLD_HALF) // size)
+        x1 = int((bounds[2] + WORLD_HALF) // size)
+        # Osa y dlaždic vede od severu k jihu
+        y0 = int((WORLD_HALF - bounds[3]) // size)
+        y1 = int((WORLD_HALF - bounds[1]) // size)
+        return (max(x0, 0), max(y0, 0), min(x1, last), min(y1, last))
+
+    def tile_path(self, zoom: int, x: int, y: int) -> str:
+        return os.path.join(self.folder, str(zoom), str(x), f"{y}.png")
+
+    def tile(self, zoom: int, x: int, y: int) -> Union[np.ndarray, None]:
+        """ Dlaždice jako pole RGBA, z cache nebo stažená a uložená do cache.
+        Vrací None, pokud dlaždici nelze získat (chyba sítě, odpověď, která
+        není obrázek). Neplatný soubor v cache se smaže. """
+
+        path = self.tile_path(zoom, x, y)
+        if os.path.exists(path):
+            try:
+                with Image.open(path) as image:
+                    return np.asarray(image.convert("RGBA"))
+            except OSError:
+                os.remove(path)
+        if self.offline:
+            return None
+
+        url = self.url.format(z=zoom, x=x, y=y, s="a", r="")
+        try:
+            response = self.session.get(url, timeout=30)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+
+        # Do cache se ukládá jen obsah, který lze načíst jako obrázek
+        try:
+            with Image.open(io.BytesIO(response.content)) as image:
+                tile = np.asarray(image.convert("RGBA"))
+        except OSError:
+            return None
+
+        # Zápis do dočasného souboru a přejmenování (souběžné procesy)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.part"
+        with open(tmp_path, "wb") as file:
+            file.write(response.content)
+        os.replace(tmp_path, path)
+        return tile
+
+    def image(self, bounds: Bounds, zoom: int = None) -> Tuple[np.ndarray, Bounds]:
+        """ Mapa složená z dlaždic pokrývajících bounds (EPSG:3857)
+        a její rozsah (xmin, ymin, xmax, ymax). Pro stejné dlaždice se
+        složený obrázek vrací z paměti. """
+
+        zoom = self.zoom_for(bounds) if zoom is None else zoom
+        x0, y0, x1, y1 = self._tile_range(bounds, zoom)
+        key = (zoom, x0, y0, x1, y1)
+        if key in self._images:
+            return self._images[key]
+
+        # Složení dlaždic do jednoho obrázku
+        image = np.zeros(((y1 - y0 + 1) * TILE_SIZE, (x1 - x0 + 1) * TILE_SIZE, 4),
+                         dtype=np.uint8)
+        for ty in range(y0, y1 + 1):
+            for tx in range(x0, x1 + 1):
+                tile = self.tile(zoom, tx, ty)
+                if tile is None or tile.shape[:2] != (TILE_SIZE, TILE_SIZE):
+                    self.missing += 1
+                    continue
+                row, col = (ty - y0) * TILE_SIZE, (tx - x0) * TILE_SIZE
+                image[row:row + TILE_SIZE, col:col + TILE_SIZE] = tile
+
+        size = self._tile_size(zoom)
+        extent = (x0 * size - WORLD_HALF, WORLD_HALF - (y1 + 1) * size,
+                  (x1 + 1) * size - WORLD_HALF, WORLD_HALF - y0 * size)
+        self._images[key] = (image, extent)
+        return self._images[key]
+
+    def add_basemap(self, ax: plt.Axes, bounds: Bounds = None,
+                    zoom: int = None) -> None:
+        """ Vykreslení podkladové mapy pod data v ax (souřadnice EPSG:3857).
+        Bez bounds se použije aktuální rozsah os. """
+
+        xlim, ylim = ax.get_xlim(), ax.get_ylim()
+        if bounds is None:
+            bounds = (min(xlim), min(ylim), max(xlim), max(ylim))
+
+        image, extent = self.image(bounds, zoom)
+        ax.imshow(image, extent=(extent[0], extent[2], extent[1], extent[3]),
+                  interpolation="bilinear", zorder=0)
+
+        # Rozsah os zůstane podle dat, ne podle obrázku
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
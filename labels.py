@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# Sdílené tabulky popisků kódovaných sloupců (kód -> popisek) pro všechny části projektu.
+# Kódy, které v tabulce chybí, dostávají výchozí popisek (viz *_DEFAULT).
+
+# Druh komunikace (p21)
+P21_LABELS = {
+    1: "Dvoupruhová komunikace",
+    2: "Třípruhová komunikace",
+    3: "Čtyřpruhová komunikace",
+    4: "Čtyřpruhová komunikace",
+    5: "Vícepruhová komunikace",
+    6: "Rychlostní komunikace",
+}
+P21_DEFAULT = "Jiná komunikace"
+
+# Zavinění nehody (p10)
+P10_LABELS = {
+    1: "řidičem",
+    2: "řidičem",
+    4: "zvěří",
+}
+P10_DEFAULT = "jiné"
+
+# Povětrnostní podmínky (p18)
+P18_LABELS = {
+    1: "neztižené",
+    2: "mlha",
+    3: "na počátku deště",
+    4: "déšť",
+    5: "sněžení",
+    6: "náledí",
+    7: "nárazový vítr",
+}
+P18_DEFAULT = "jiné"
+
+# Místní úprava přednosti (p24), kód je index do seznamu
+P24_LABELS = [
+    "Žádná úprava",
+    "Přerušovaná žlutá",
+    "Semafor mimo provoz",
+    "Dopravní značky",
+    "Přenosné dopravní značky",
+    "Nevyznačena",
+]
+
+# Automobilové výrobní značky (p45a)
+CAR_BRANDS = {
+    1: "ALFA-ROMEO",
+    2: "AUDI",
+    3: "AVIA",
+    4: "BMW",
+    5: "CHEVROLET",
+    6: "CHRYSLER",
+    7: "CITROEN",
+    8: "DACIA",
+    9: "DAEWOO",
+    10: "DAF",
+    11: "DODGE",
+    12: "FIAT ",
+    13: "FORD",
+    14: "GAZ, VOLHA",
+    15: "FERRARI",
+    16: "HONDA",
+    17: "HYUNDAI",
+    18: "IFA",
+    19: "IVECO",
+    20: "JAGUAR",
+    21: "JEEP",
+    22: "LANCIA",
+    23: "LAND ROVER",
+    24: "LIAZ",
+    25: "MAZDA",
+    26: "MERCEDES",
+    27: "MITSUBISHI",
+    28: "MOSKVIČ",
+    29: "NISSAN",
+    30: "OLTCIT",
+    31: "OPEL",
+    32: "PEUGEOT",
+    33: "PORSCHE",
+    34: "PRAGA",
+    35: "RENAULT",
+    36: "ROVER",
+    37: "SAAB",
+    38: "SEAT",
+    39: "ŠKODA",
+    40: "SCANIA",
+    41: "SUBARU",
+    42: "SUZUKI",
+    43: "TATRA",
+    44: "TOYOTA",
+    45: "TRABANT",
+    46: "VAZ",
+    47: "VOLKSWAGEN",
+    48: "VOLVO",
+    49: "WARTBURG",
+    50: "ZASTAVA",
+    51: "AGM",
+    52: "ARO",
+    53: "AUSTIN",
+    54: "BARKAS",
+    55: "DAIHATSU",
+    56: "DATSUN",
+    57: "DESTACAR",
+    58: "ISUZU",
+    59: "KAROSA",
+    60: "KIA",
+    61: "LUBLIN",
+    62: "MAN",
+    63: "MASERATI",
+    64: "MULTICAR",
+    65: "PONTIAC",
+    66: "ROSS",
+    67: "SIMCA",
+    68: "SSANGYONG",
+    69: "TALBOT",
+    70: "TAZ",
+    71: "ZAZ",
+}
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# Dávkové vykreslení všech grafů zprávy paralelně bez zobrazení (backend Agg).
+# Data se načtou jednou, uloží se po sloupcích do .npy souborů a pracovní procesy
+# je otevírají jen pro čtení (memmap), mezi procesy se tedy nekopírují.
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class Figure(NamedTuple):
+    """Graf zprávy: funkce module.function z adresáře directory."""
+    directory: str
+    module: str
+    function: str
+    filename: str
+    columns: List[str]
+    # Vstup funkce: "frame" (DataFrame), "analysis" (DataFrame se sloupcem date),
+    # "geo" (DataFrame s promítnutými souřadnicemi, geo.project) nebo "dict" (slovník numpy polí)
+    data: str
+
+
+FIGURES: Dict[str, Figure] = {
+    "roadtype": Figure("izv-part02", "analysis", "plot_roadtype", "01_roadtype.png",
+                       ["region", "p2a", "p21"], "analysis"),
+    "animals": Figure("izv-part02", "analysis", "plot_animals", "02_animals.png",
+                      ["region", "p2a", "p10"], "analysis"),
+    "conditions": Figure("izv-part02", "analysis", "plot_conditions", "03_conditions.png",
+                         ["region", "p2a", "p18"], "analysis"),
+    "geo": Figure("izv-part03-var-nehody", "geo", "plot_geo", "geo1.png",
+                  ["region", "p2a", "p36", "d", "e"], "geo"),
+    "cluster": Figure("izv-part03-var-nehody", "geo", "plot_cluster", "geo2.png",
+                      ["region", "p2a", "p36", "d", "e"], "geo"),
+    "doc": Figure("izv-part03-var-nehody", "doc", "plot_doc", "fig.png",
+                  ["p44", "p45a", "p53"], "frame"),
+    "stat": Figure("izv-part01", "get_stat", "plot_stat", "stat.png",
+                   ["region", "p24"], "dict"),
+}
+
+# Popis sdílených sloupců (kategorie řetězcových sloupců)
+META_FILENAME = "meta.json"
+
+
+def share_frame(df: pd.DataFrame, folder: str) -> None:
+    """Uloží sloupce df do folder jako .npy soubory pro čtení přes memmap.
+    Řetězcové sloupce se ukládají jako kódy int32 a seznam kategorií v meta.json."""
+    meta = {"length": len(df), "categories": {}}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object:
+            codes, categories = pd.factorize(values)
+            meta["categories"][col] = categories.tolist()
+            values = codes.astype(np.int32)
+        np.save(os.path.join(folder, f"{col}.npy"), np.asarray(values))
+
+    with open(os.path.join(folder, META_FILENAME), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+
+
+def load_shared(folder: str, columns: List[str]) -> Dict[str, np.ndarray]:
+    """Otevře sdílené sloupce jen pro čtení, řetězcové sloupce se dekódují z kódů."""
+    with open(os.path.join(folder, META_FILENAME), "r", encoding="utf-8") as file:
+        meta = json.load(file)
+
+    data = {}
+    for col in columns:
+        values = np.load(os.path.join(folder, f"{col}.npy"), mmap_mode="r")
+        if col in meta["categories"]:
+            # Kód -1 (chybějící hodnota) ukazuje na přidané None
+            categories = np.array(meta["categories"][col] + [None], dtype=object)
+            values = categories[values]
+        data[col] = values
+    return data
+
+
+def _init_worker() -> None:
+    """Inicializace pracovního procesu: backend bez zobrazení, cesty k modulům."""
+    import matplotlib
+    matplotlib.use("Agg")
+    for figure in FIGURES.values():
+        directory = os.path.join(ROOT, figure.directory)
+        if directory not in sys.path:
+            sys.path.append(directory)
+
+
+def _figure_input(figure: Figure, data: Dict[str, np.ndarray]):
+    """Vstup funkce grafu ze sdílených sloupců."""
+    if figure.data == "dict":
+        # Jako DataDownloader.get_dict: bez řádků s neznámými hodnotami (v souboru nehod -1)
+        valid = np.ones(len(next(iter(data.values()))), dtype=bool)
+        for values in data.values():
+            if values.dtype.kind == "i":
+                valid &= values >= 0
+        return data if valid.all() else {col: values[valid] for col, values in data.items()}
+
+    df = pd.DataFrame(data, copy=False)
+    if figure.data == "analysis":
+        df["date"] = pd.to_datetime(df["p2a"], format="%Y-%m-%d")
+    elif figure.data == "geo":
+        df = importlib.import_module("geo").project(df)
+    return df
+
+
+def _render(args: Tuple[str, str, str]) -> Tuple[str, str, float, float, Optional[str]]:
+    """Vykreslí jeden graf do dočasného souboru a přejmenuje ho na cílový.
+    Vrací (název, cesta, čas přípravy dat, čas vykreslení, chyba)."""
+    name, folder, fig_location = args
+    figure = FIGURES[name]
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    try:
+        plot = getattr(importlib.import_module(figure.module), figure.function)
+        source = _figure_input(figure, load_shared(folder, figure.columns))
+        prepared = time.perf_counter()
+
+        # Zápis do dočasného souboru (stejná přípona kvůli formátu), pak atomické přejmenování
+        root, ext = os.path.splitext(fig_location)
+        tmp_location = f"{root}.tmp{ext}"
+        plot(source, tmp_location, False)
+        os.replace(tmp_location, fig_location)
+    except Exception as error:
+        return name, fig_location, time.perf_counter() - start, 0.0, f"{type(error).__name__}: {error}"
+    finally:
+        plt.close("all")
+
+    return name, fig_location, prepared - start, time.perf_counter() - prepared, None
+
+
+def render(filename: str, output: str, names: Optional[List[str]] = None,
+           workers: Optional[int] = None) -> Dict[str, Tuple[float, float, Optional[str]]]:
+    """Vykreslí grafy names (výchozí všechny) z dat filename do adresáře output.
+    Vrací pro každý graf (čas přípravy dat, čas vykreslení, chyba nebo None)."""
+    names = list(FIGURES) if names is None else names
+    output = os.path.abspath(output)
+    os.makedirs(output, exist_ok=True)
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=output) as folder:
+        # Načtení dat jednou, sdíleny jsou jen sloupce potřebné pro vybrané grafy
+        start = time.perf_counter()
+        columns = sorted({col for name in names for col in FIGURES[name].columns})
+        df = pd.read_pickle(filename)
+        share_frame(df[columns], folder)
+        del df
+        print(f"data: {time.perf_counter() - start:.2f} s")
+
+        tasks = [(name, folder, os.path.join(output, FIGURES[name].filename)) for name in names]
+        with Pool(workers or min(len(tasks), os.cpu_count()), initializer=_init_worker) as pool:
+            for name, fig_location, load_time, render_time, error in pool.imap_unordered(_render, tasks):
+                results[name] = (load_time, render_time, error)
+                if error is None:
+                    print(f"{name}: data {load_time:.2f} s, vykreslení {render_time:.2f} s -> {fig_location}")
+                else:
+                    print(f"{name}: CHYBA {error}")
+    return results
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("filename", nargs="?", default="accidents.pkl.gz", help="Data file (DataFrame pickle)")
+    parser.add_argument("--output", type=str, default="figures", help="Output directory")
+    parser.add_argument("--figures", nargs="+", choices=list(FIGURES), default=None, help="Figures to render")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    results = render(args.filename, args.output, args.figures, args.workers)
+    if any(error is not None for _, _, error in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()